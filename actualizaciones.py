@@ -0,0 +1,88 @@
+import threading
+import time
+
+from temporizador import rueda_ui
+
+
+class ProgramadorActualizaciones:
+    """Agrupa las actualizaciones de la UI de todos los hilos en cuadros.
+
+    Los productores (reloj, lecturas, alarmas, notificaciones, alertas)
+    marcan los controles que cambiaron; como mucho FPS_MAXIMO veces por
+    segundo se envía un solo page.update() con todos ellos. Marcar sin
+    controles pide actualizar la página completa (p. ej. abrir un SnackBar).
+    """
+
+    FPS_MAXIMO = 20
+
+    def __init__(self, page, rueda=None):
+        self.page = page
+        self.rueda = rueda or rueda_ui
+        self._lock = threading.Lock()
+        self._sucios = {}  # id(control) -> control
+        self._pagina_completa = False
+        self._programado = False
+        self._ultimo_envio = 0.0
+        self.envios = 0
+        self.marcas = 0
+
+    def marcar(self, *controles):
+        """Pide actualizar estos controles (o toda la página) en el próximo cuadro"""
+        with self._lock:
+            self.marcas += 1
+            if controles:
+                for control in controles:
+                    self._sucios[id(control)] = control
+            else:
+                self._pagina_completa = True
+
+            if self._programado:
+                return
+            self._programado = True
+            espera = max(0.0, self._ultimo_envio + 1.0 / self.FPS_MAXIMO - time.monotonic())
+        self.rueda.programar(espera, self._vaciar, clave=("cuadro_ui", id(self)))
+
+    def _vaciar(self):
+        """Envía en un solo update todo lo marcado desde el último cuadro"""
+        with self._lock:
+            controles = list(self._sucios.values())
+            pagina_completa = self._pagina_completa
+            self._sucios = {}
+            self._pagina_completa = False
+            self._programado = False
+            self._ultimo_envio = time.monotonic()
+
+        if not controles and not pagina_completa:
+            return
+        try:
+            if pagina_completa:
+                self.page.update()
+            else:
+                # Los controles que no están montados se envían al mostrarse
+                montados = [c for c in controles if getattr(c, "page", None) is not None]
+                if montados:
+                    self.page.update(*montados)
+            self.envios += 1
+        except Exception as e:
+            print(f"ProgramadorActualizaciones: Error actualizando, se envía la página completa: {e}")
+            try:
+                self.page.update()
+            except Exception as e2:
+                print(f"ProgramadorActualizaciones: Error actualizando página: {e2}")
+
+
+_lock_programadores = threading.Lock()
+
+
+def programar_actualizacion(page, *controles):
+    """Marca controles de `page` para el próximo cuadro (sin controles: página completa)"""
+    if page is None:
+        return
+    programador = getattr(page, "programador_actualizaciones", None)
+    if programador is None:
+        with _lock_programadores:
+            programador = getattr(page, "programador_actualizaciones", None)
+            if programador is None:
+                programador = ProgramadorActualizaciones(page)
+                page.programador_actualizaciones = programador
+    programador.marcar(*controles)
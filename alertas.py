@@ -4,105 +4,416 @@ import os
 import datetime
 import threading
 import time
+import shutil
+import atexit
+import hashlib
+import re
+from temporizador import rueda_ui
+from actualizaciones import programar_actualizacion
+
+ESQUEMA_ALERTA = 2
+
+def normalizar_alerta(alerta):
+    """Convierte una alerta v1 (fecha/hora en texto) al esquema con timestamp"""
+    if "ts" in alerta:
+        return alerta
+    try:
+        if alerta.get("fecha_hora_completa"):
+            momento = datetime.datetime.fromisoformat(alerta["fecha_hora_completa"])
+        else:
+            momento = datetime.datetime.strptime(f"{alerta['fecha']} {alerta['hora']}", "%Y-%m-%d %H:%M")
+    except (KeyError, TypeError, ValueError):
+        return alerta
+    normalizada = {k: v for k, v in alerta.items() if k not in ("fecha", "hora", "fecha_hora_completa")}
+    normalizada["v"] = ESQUEMA_ALERTA
+    normalizada["ts"] = int(momento.timestamp())
+    return normalizada
+
+def huella_alerta(causa, pagina, elemento, tipo):
+    """Huella de una alerta: causa sin números (plantilla), página, elemento y tipo"""
+    plantilla = re.sub(r"\d+(?:[.,]\d+)?", "#", causa or "")
+    texto = "|".join(str(x) for x in (plantilla, pagina, elemento, tipo))
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=8).hexdigest()
 
 class SistemaAlertas:
-    def __init__(self, archivo="alertas.json"):
+    # Eventos que reciben los suscriptores: callback(evento, ids)
+    EVENTO_AGREGADA = "agregada"
+    EVENTO_ACTUALIZADA = "actualizada"
+    EVENTO_ELIMINADA = "eliminada"
+    EVENTO_LIMPIADAS = "limpiadas"
+
+    # Escritura diferida: los cambios se guardan en grupo cada INTERVALO_GUARDADO
+    # segundos o al juntar LOTE_GUARDADO cambios, nunca más de una vez por
+    # INTERVALO_MINIMO segundos. Con intervalo_guardado=0 se guarda en cada cambio.
+    INTERVALO_GUARDADO = 5.0
+    INTERVALO_MINIMO = 1.0
+    LOTE_GUARDADO = 50
+    # Campos con índice secundario (valor -> {id: alerta})
+    CAMPOS_INDICE = ("pagina", "elemento", "tipo")
+
+    def __init__(self, archivo="alertas.json", intervalo_guardado=None, lote_guardado=None, fsync=True,
+                 ventana_deduplicacion=None):
         self.archivo = archivo
-        self.alertas = []
+        self.alertas = {}  # id -> alerta, en orden de id
+        self._indices = {campo: {} for campo in self.CAMPOS_INDICE}
+        self._conteo_pagina_elemento = {}
+        # Deduplicación opcional: repeticiones con la misma huella dentro de
+        # la ventana (segundos) se acumulan en una sola alerta con "count"
+        self.ventana_deduplicacion = ventana_deduplicacion
+        self._por_huella = {}  # huella -> id de la alerta más reciente
+        self._suscriptores = []
         self.proximo_id = 1
+        self.intervalo_guardado = self.INTERVALO_GUARDADO if intervalo_guardado is None else intervalo_guardado
+        self.lote_guardado = lote_guardado or self.LOTE_GUARDADO
+        self.fsync = fsync
+        self.guardados = 0
+
+        self._lock = threading.RLock()
+        self._condicion = threading.Condition(self._lock)
+        self._pendientes = 0
+        self._primer_pendiente = None
+        self._ultimo_guardado = 0.0
+        self._activo = True
+
         self.cargar_alertas()
         self.ultima_modificacion = time.time()
+
+        self._hilo_guardado = None
+        if self.intervalo_guardado:
+            self._hilo_guardado = threading.Thread(target=self._loop_guardado, daemon=True)
+            self._hilo_guardado.start()
+            atexit.register(self.cerrar)
         
     def cargar_alertas(self):
         """Carga las alertas desde archivo JSON"""
         if os.path.exists(self.archivo):
             try:
                 with open(self.archivo, "r", encoding='utf-8') as f:
-                    self.alertas = json.load(f)
+                    alertas = json.load(f)
+                normalizadas = [normalizar_alerta(a) for a in alertas]
+                self._reindexar(normalizadas)
                 
-                if self.alertas:
-                    max_id = max(alerta.get("id", 0) for alerta in self.alertas)
-                    self.proximo_id = max_id + 1
-                else:
-                    self.proximo_id = 1
-                    
+                # Migración única: si había alertas v1, respaldar y reescribir con timestamps
+                if any(a is not n for a, n in zip(alertas, normalizadas)):
+                    shutil.copy2(self.archivo, self.archivo + ".bak")
+                    self.guardar_alertas()
+                    print(f"SistemaAlertas: Alertas migradas a esquema v{ESQUEMA_ALERTA} (respaldo en {self.archivo}.bak)")
+                
+                self.proximo_id = self.obtener_max_id() + 1
                 print(f"SistemaAlertas: {len(self.alertas)} alertas cargadas, próximo ID: {self.proximo_id}")
             except Exception as e:
                 print(f"SistemaAlertas: Error cargando alertas: {e}")
-                self.alertas = []
+                self._reindexar([])
                 self.proximo_id = 1
-        return self.alertas
+        return list(self.alertas.values())
+    
+    # ---------- ÍNDICES ----------
+    
+    def _reindexar(self, alertas):
+        """Reconstruye el mapa por id y los índices secundarios"""
+        with self._lock:
+            self.alertas = {}
+            self._indices = {campo: {} for campo in self.CAMPOS_INDICE}
+            self._conteo_pagina_elemento = {}
+            self._por_huella = {}
+            for alerta in sorted(alertas, key=lambda a: a.get("id", 0)):
+                self._indexar(alerta)
+    
+    def _indexar(self, alerta):
+        self.alertas[alerta["id"]] = alerta
+        for campo in self.CAMPOS_INDICE:
+            self._indices[campo].setdefault(alerta.get(campo), {})[alerta["id"]] = alerta
+        clave = (alerta.get("pagina"), alerta.get("elemento"))
+        self._conteo_pagina_elemento[clave] = self._conteo_pagina_elemento.get(clave, 0) + 1
+        if alerta.get("huella"):
+            self._por_huella[alerta["huella"]] = alerta["id"]
+    
+    def _desindexar(self, alerta):
+        del self.alertas[alerta["id"]]
+        for campo in self.CAMPOS_INDICE:
+            grupo = self._indices[campo][alerta.get(campo)]
+            del grupo[alerta["id"]]
+            if not grupo:
+                del self._indices[campo][alerta.get(campo)]
+        clave = (alerta.get("pagina"), alerta.get("elemento"))
+        self._conteo_pagina_elemento[clave] -= 1
+        if not self._conteo_pagina_elemento[clave]:
+            del self._conteo_pagina_elemento[clave]
+        if alerta.get("huella") and self._por_huella.get(alerta["huella"]) == alerta["id"]:
+            del self._por_huella[alerta["huella"]]
+    
+    def _actualizar_indices(self, alerta, anteriores):
+        """Mueve la alerta entre grupos de los índices secundarios tras cambiar sus campos.
+        
+        La alerta no se mueve en self.alertas y cada grupo sigue en orden de id.
+        """
+        for campo, valor_anterior in anteriores.items():
+            valor = alerta.get(campo)
+            if valor == valor_anterior:
+                continue
+            grupo = self._indices[campo][valor_anterior]
+            del grupo[alerta["id"]]
+            if not grupo:
+                del self._indices[campo][valor_anterior]
+            destino = self._indices[campo].setdefault(valor, {})
+            if destino and next(reversed(destino)) > alerta["id"]:
+                # Insertar en su lugar: reconstruir el grupo en orden de id
+                destino[alerta["id"]] = alerta
+                self._indices[campo][valor] = dict(sorted(destino.items()))
+            else:
+                destino[alerta["id"]] = alerta
+        
+        clave_anterior = (anteriores["pagina"], anteriores["elemento"])
+        clave = (alerta.get("pagina"), alerta.get("elemento"))
+        if clave != clave_anterior:
+            self._conteo_pagina_elemento[clave_anterior] -= 1
+            if not self._conteo_pagina_elemento[clave_anterior]:
+                del self._conteo_pagina_elemento[clave_anterior]
+            self._conteo_pagina_elemento[clave] = self._conteo_pagina_elemento.get(clave, 0) + 1
     
     def guardar_alertas(self):
-        """Guarda las alertas en archivo JSON"""
+        """Guarda las alertas en archivo JSON (escribe un temporal y lo reemplaza)"""
+        with self._lock:
+            # Copia superficial: las alertas pueden modificarse mientras se escribe
+            instantanea = [dict(alerta) for alerta in self.alertas.values()]
+            pendientes = self._pendientes
+            self._pendientes = 0
+            self._primer_pendiente = None
+            self._ultimo_guardado = time.monotonic()
         try:
-            with open(self.archivo, "w", encoding='utf-8') as f:
-                json.dump(self.alertas, f, ensure_ascii=False, indent=4)
-            self.ultima_modificacion = time.time()
+            temporal = self.archivo + ".tmp"
+            with open(temporal, "w", encoding='utf-8') as f:
+                json.dump(instantanea, f, ensure_ascii=False, indent=4)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temporal, self.archivo)
+            self.guardados += 1
         except Exception as e:
             print(f"SistemaAlertas: Error guardando alertas: {e}")
+            # Reintentar en el siguiente ciclo
+            with self._lock:
+                self._pendientes += pendientes
+                if self._primer_pendiente is None:
+                    self._primer_pendiente = time.monotonic()
+    
+    def _marcar_cambio(self, evento, ids):
+        """Registra un cambio, avisa a los suscriptores y lo guarda ahora o en el próximo grupo"""
+        self.ultima_modificacion = time.time()
+        if not self._hilo_guardado:
+            self.guardar_alertas()
+        else:
+            with self._condicion:
+                self._pendientes += 1
+                if self._primer_pendiente is None:
+                    self._primer_pendiente = time.monotonic()
+                if self._pendientes == 1 or self._pendientes >= self.lote_guardado:
+                    self._condicion.notify()
+        self._publicar(evento, ids)
+    
+    # ---------- SUSCRIPCIONES ----------
+    
+    def suscribir(self, callback):
+        """Registra callback(evento, ids) para recibir los cambios de alertas"""
+        with self._lock:
+            if callback not in self._suscriptores:
+                self._suscriptores.append(callback)
+        return callback
+    
+    def desuscribir(self, callback):
+        """Deja de notificar a callback"""
+        with self._lock:
+            if callback in self._suscriptores:
+                self._suscriptores.remove(callback)
+    
+    def _publicar(self, evento, ids):
+        """Avisa a los suscriptores fuera del lock (pueden volver a consultar el sistema)"""
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for callback in suscriptores:
+            try:
+                callback(evento, ids)
+            except Exception as e:
+                print(f"SistemaAlertas: Error notificando {evento}: {e}")
+    
+    def _loop_guardado(self):
+        """Hilo que guarda los cambios pendientes en grupo"""
+        while True:
+            with self._condicion:
+                while self._activo:
+                    ahora = time.monotonic()
+                    if self._pendientes:
+                        vence = self._primer_pendiente + self.intervalo_guardado
+                        if self._pendientes >= self.lote_guardado:
+                            vence = ahora
+                        vence = max(vence, self._ultimo_guardado + self.INTERVALO_MINIMO)
+                        if vence <= ahora:
+                            break
+                        self._condicion.wait(vence - ahora)
+                    else:
+                        self._condicion.wait()
+                if not self._activo:
+                    return
+            self.guardar_alertas()
+    
+    def flush(self):
+        """Guarda de inmediato los cambios pendientes"""
+        with self._lock:
+            hay_pendientes = self._pendientes > 0
+        if hay_pendientes:
+            self.guardar_alertas()
     
-    def agregar_alerta(self, causa, pagina, elemento=None, valor=None, tipo=None):
+    def cerrar(self):
+        """Detiene el hilo de guardado y guarda lo pendiente"""
+        with self._condicion:
+            if not self._activo:
+                return
+            self._activo = False
+            self._condicion.notify_all()
+        if self._hilo_guardado:
+            self._hilo_guardado.join(timeout=5)
+        self.flush()
+    
+    def agregar_alerta(self, causa, pagina, elemento=None, valor=None, tipo=None, deduplicar=True):
         """Agrega una nueva alerta con información detallada"""
-        ahora = datetime.datetime.now()
-        fecha = ahora.strftime("%Y-%m-%d")
-        hora = ahora.strftime("%H:%M")
+        elemento = elemento if elemento else "General"
+        tipo = tipo if tipo else "advertencia"
+        if self.ventana_deduplicacion and deduplicar:
+            repetida = self._acumular_repeticion(causa, pagina, elemento, valor, tipo)
+            if repetida is not None:
+                return repetida
         
-        alerta = {
-            "id": self.proximo_id,
-            "causa": causa,
-            "pagina": pagina,
-            "elemento": elemento if elemento else "General",
-            "valor": str(valor) if valor is not None else "N/A",
-            "tipo": tipo if tipo else "advertencia",
-            "fecha": fecha,
-            "hora": hora,
-            "fecha_hora_completa": ahora.isoformat()
-        }
-        self.alertas.append(alerta)
-        self.proximo_id += 1
-        self.guardar_alertas()
+        with self._lock:
+            alerta = {
+                "v": ESQUEMA_ALERTA,
+                "id": self.proximo_id,
+                "ts": int(time.time()),
+                "causa": causa,
+                "pagina": pagina,
+                "elemento": elemento,
+                "valor": str(valor) if valor is not None else "N/A",
+                "tipo": tipo
+            }
+            if self.ventana_deduplicacion and deduplicar:
+                alerta.update(
+                    huella=huella_alerta(causa, pagina, elemento, tipo),
+                    count=1,
+                    first_seen=alerta["ts"],
+                    last_seen=alerta["ts"]
+                )
+            self._indexar(alerta)
+            self.proximo_id += 1
+        self._marcar_cambio(self.EVENTO_AGREGADA, [alerta["id"]])
         
         # Log detallado
-        elemento_info = f" [{elemento}]" if elemento else ""
+        elemento_info = f" [{elemento}]" if elemento != "General" else ""
         valor_info = f" (Valor: {valor})" if valor else ""
         print(f"Alerta #{alerta['id']} agregada: {pagina}{elemento_info} - {causa}{valor_info}")
         return alerta
     
+    def _acumular_repeticion(self, causa, pagina, elemento, valor, tipo):
+        """Suma una repetición a la alerta con la misma huella si está dentro de la ventana"""
+        huella = huella_alerta(causa, pagina, elemento, tipo)
+        ahora = int(time.time())
+        with self._lock:
+            alerta = self.alertas.get(self._por_huella.get(huella))
+            if alerta is None or ahora - alerta.get("last_seen", alerta["ts"]) > self.ventana_deduplicacion:
+                return None
+            alerta["count"] = alerta.get("count", 1) + 1
+            alerta["last_seen"] = ahora
+            alerta["causa"] = causa
+            alerta["valor"] = str(valor) if valor is not None else "N/A"
+        self._marcar_cambio(self.EVENTO_ACTUALIZADA, [alerta["id"]])
+        return alerta
+    
+    def actualizar_alerta(self, id_alerta, **campos):
+        """Modifica campos de una alerta existente (p. ej. el episodio en curso)"""
+        with self._lock:
+            alerta = self.alertas.get(id_alerta)
+            if alerta is None:
+                return None
+            anteriores = {campo: alerta.get(campo) for campo in self.CAMPOS_INDICE}
+            alerta.update(campos)
+            self._actualizar_indices(alerta, anteriores)
+        self._marcar_cambio(self.EVENTO_ACTUALIZADA, [id_alerta])
+        return alerta
+    
     def eliminar_alerta(self, id_alerta):
         """Elimina una alerta por su ID"""
-        for i, alerta in enumerate(self.alertas):
-            if alerta["id"] == id_alerta:
-                self.alertas.pop(i)
-                self.guardar_alertas()
-                print(f"Alerta {id_alerta} eliminada")
-                return True
-        return False
+        with self._lock:
+            alerta = self.alertas.get(id_alerta)
+            if alerta is None:
+                return False
+            self._desindexar(alerta)
+        self._marcar_cambio(self.EVENTO_ELIMINADA, [id_alerta])
+        print(f"Alerta {id_alerta} eliminada")
+        return True
     
     def eliminar_todas_alertas(self):
         """Elimina todas las alertas"""
-        self.alertas.clear()
-        self.proximo_id = 1
-        self.guardar_alertas()
+        with self._lock:
+            ids = list(self.alertas)
+            self._reindexar([])
+            self.proximo_id = 1
+        self._marcar_cambio(self.EVENTO_LIMPIADAS, ids)
         print("Todas las alertas eliminadas, IDs reiniciados")
     
-    def obtener_alertas(self, filtro_pagina=None, filtro_elemento=None):
-        """Obtiene todas las alertas, opcionalmente filtradas por página y elemento"""
-        alertas_filtradas = self.alertas.copy()
-        
-        if filtro_pagina:
-            alertas_filtradas = [a for a in alertas_filtradas if a["pagina"] == filtro_pagina]
-        
-        if filtro_elemento:
-            alertas_filtradas = [a for a in alertas_filtradas if a["elemento"] == filtro_elemento]
-        
-        return alertas_filtradas
+    def obtener_alertas(self, filtro_pagina=None, filtro_elemento=None, filtro_tipo=None):
+        """Obtiene las alertas en orden de id, opcionalmente filtradas por página, elemento y tipo"""
+        with self._lock:
+            filtros = [
+                (campo, valor)
+                for campo, valor in (("pagina", filtro_pagina), ("elemento", filtro_elemento), ("tipo", filtro_tipo))
+                if valor
+            ]
+            if not filtros:
+                return list(self.alertas.values())
+            
+            # Partir del índice más pequeño y comprobar el resto de filtros
+            grupos = [self._indices[campo].get(valor, {}) for campo, valor in filtros]
+            base = min(grupos, key=len)
+            return [
+                alerta for alerta in base.values()
+                if all(alerta.get(campo) == valor for campo, valor in filtros)
+            ]
+    
+    def obtener_alertas_recientes(self, limite, antes_de_id=None, filtro_pagina=None, filtro_elemento=None):
+        """Devuelve hasta `limite` alertas de la más nueva a la más antigua (con id < antes_de_id)"""
+        with self._lock:
+            filtros = [(c, v) for c, v in (("pagina", filtro_pagina), ("elemento", filtro_elemento)) if v]
+            base = self.alertas
+            if filtros:
+                base = min((self._indices[c].get(v, {}) for c, v in filtros), key=len)
+            
+            resultado = []
+            for id_alerta in reversed(base):
+                if antes_de_id is not None and id_alerta >= antes_de_id:
+                    continue
+                alerta = base[id_alerta]
+                if all(alerta.get(c) == v for c, v in filtros):
+                    resultado.append(alerta)
+                    if len(resultado) >= limite:
+                        break
+            return resultado
     
-    def contar_alertas(self, filtro_pagina=None, filtro_elemento=None):
-        """Cuenta el total de alertas, opcionalmente filtradas"""
-        if filtro_pagina or filtro_elemento:
-            return len(self.obtener_alertas(filtro_pagina, filtro_elemento))
-        return len(self.alertas)
+    def obtener_alerta(self, id_alerta):
+        """Devuelve la alerta con ese id o None"""
+        return self.alertas.get(id_alerta)
+    
+    def contar_alertas(self, filtro_pagina=None, filtro_elemento=None, filtro_tipo=None):
+        """Cuenta las alertas, opcionalmente filtradas (O(1) salvo al filtrar por tipo y otro campo)"""
+        with self._lock:
+            if filtro_tipo and (filtro_pagina or filtro_elemento):
+                return len(self.obtener_alertas(filtro_pagina, filtro_elemento, filtro_tipo))
+            if filtro_tipo:
+                return len(self._indices["tipo"].get(filtro_tipo, {}))
+            if filtro_pagina and filtro_elemento:
+                return self._conteo_pagina_elemento.get((filtro_pagina, filtro_elemento), 0)
+            if filtro_pagina:
+                return len(self._indices["pagina"].get(filtro_pagina, {}))
+            if filtro_elemento:
+                return len(self._indices["elemento"].get(filtro_elemento, {}))
+            return len(self.alertas)
     
     def obtener_timestamp_modificacion(self):
         """Obtiene el timestamp de última modificación"""
@@ -110,29 +421,150 @@ class SistemaAlertas:
     
     def obtener_max_id(self):
         """Obtiene el ID máximo actual"""
-        if not self.alertas:
-            return 0
-        return max(alerta.get("id", 0) for alerta in self.alertas)
+        with self._lock:
+            # Las alertas se guardan en orden de id: la última es la de mayor id
+            return next(reversed(self.alertas), 0)
     
     def obtener_elementos_unicos(self):
         """Obtiene una lista de elementos únicos que han generado alertas"""
-        elementos = set()
-        for alerta in self.alertas:
-            if alerta.get("elemento") and alerta["elemento"] != "General":
-                elementos.add(alerta["elemento"])
-        return sorted(list(elementos))
+        with self._lock:
+            return sorted(e for e in self._indices["elemento"] if e and e != "General")
+
+class DetectorEpisodios:
+    """Convierte lecturas continuas en episodios de alerta con histéresis.
+
+    Cada canal se configura con {"activar", "liberar", "permanencia", "causa",
+    "unidad", "elemento", "tipo"}: el episodio se abre cuando la lectura supera
+    "activar" durante "permanencia" segundos y se cierra cuando baja de
+    "liberar" durante el mismo tiempo. Mientras dura se actualiza una única
+    alerta (inicio, fin, pico y número de muestras) en lugar de crear una
+    alerta por lectura.
+    """
+
+    def __init__(self, sistema_alertas, pagina, canales):
+        self.sistema = sistema_alertas
+        self.pagina = pagina
+        self.canales = canales
+        self.estados = {
+            canal: {"activo": False, "desde": None, "alerta_id": None, "pico": None, "inicio": None, "muestras": 0}
+            for canal in canales
+        }
+        self._retomar_abiertos()
+
+    def _retomar_abiertos(self):
+        """Retoma el episodio que quedó abierto en cada canal (reinicio o nueva sesión).
+
+        Si en un canal quedaron varios abiertos, los anteriores se cierran al
+        inicio del siguiente y se continúa el más reciente.
+        """
+        for canal, config in self.canales.items():
+            abiertos = []
+            for alerta in self.sistema.obtener_alertas(filtro_pagina=self.pagina,
+                                                       filtro_elemento=config.get("elemento") or "General"):
+                episodio = alerta.get("episodio")
+                if episodio and episodio.get("fin") is None:
+                    abiertos.append(alerta)
+            for anterior, siguiente in zip(abiertos, abiertos[1:]):
+                episodio = dict(anterior["episodio"], fin=siguiente["episodio"]["inicio"])
+                self.sistema.actualizar_alerta(anterior["id"], episodio=episodio)
+            if abiertos:
+                episodio = abiertos[-1]["episodio"]
+                self.estados[canal].update(
+                    activo=True, desde=None, alerta_id=abiertos[-1]["id"],
+                    pico=episodio["pico"], inicio=episodio["inicio"], muestras=episodio["muestras"]
+                )
+
+    def evaluar(self, canal, valor, ahora=None):
+        """Procesa una lectura; devuelve la alerta si se abrió o cambió un episodio"""
+        config = self.canales[canal]
+        estado = self.estados[canal]
+        ahora = time.time() if ahora is None else ahora
+
+        if not estado["activo"]:
+            if valor <= config["activar"]:
+                estado["desde"] = None
+                return None
+            if estado["desde"] is None:
+                estado.update(desde=ahora, inicio=ahora, pico=valor, muestras=0)
+            estado["pico"] = max(estado["pico"], valor)
+            estado["muestras"] += 1
+            if ahora - estado["desde"] < config.get("permanencia", 0):
+                return None
+            return self._abrir(config, estado)
+
+        estado["muestras"] += 1
+        if valor > config["liberar"]:
+            estado["desde"] = None
+            if valor > estado["pico"]:
+                estado["pico"] = valor
+                return self._actualizar(config, estado)
+            return None
+
+        if estado["desde"] is None:
+            estado["desde"] = ahora
+        if ahora - estado["desde"] < config.get("permanencia", 0):
+            return None
+        return self._cerrar(estado, ahora)
+
+    def _causa(self, config, pico):
+        return f"{config['causa']}: {pico}{config['unidad']} (supera {config['activar']}{config['unidad']})"
+
+    def _abrir(self, config, estado):
+        alerta = self.sistema.agregar_alerta(
+            causa=self._causa(config, estado["pico"]),
+            pagina=self.pagina,
+            elemento=config.get("elemento"),
+            valor=estado["pico"],
+            tipo=config.get("tipo"),
+            deduplicar=False
+        )
+        alerta = self.sistema.actualizar_alerta(alerta["id"], episodio=self._episodio(estado, None))
+        estado.update(activo=True, desde=None, alerta_id=alerta["id"])
+        return alerta
+
+    def _actualizar(self, config, estado):
+        return self.sistema.actualizar_alerta(
+            estado["alerta_id"],
+            causa=self._causa(config, estado["pico"]),
+            valor=str(estado["pico"]),
+            episodio=self._episodio(estado, None)
+        )
+
+    def _cerrar(self, estado, ahora):
+        alerta = self.sistema.actualizar_alerta(estado["alerta_id"], episodio=self._episodio(estado, ahora))
+        estado.update(activo=False, desde=None, alerta_id=None, pico=None, inicio=None, muestras=0)
+        return alerta
+
+    def _episodio(self, estado, fin):
+        return {
+            "inicio": int(estado["inicio"]),
+            "fin": int(fin) if fin is not None else None,
+            "pico": estado["pico"],
+            "muestras": estado["muestras"]
+        }
 
 # ---------- UI MEJORADA ----------
 class AlertasView(ft.Container):
+    # Filas que se dibujan de una vez; el resto se carga al llegar al final
+    TAMANO_PAGINA = 50
+
     def __init__(self, sistema_alertas=None, page=None):
         super().__init__()
         self.sistema = sistema_alertas or SistemaAlertas()
         self.page = page
         self.filtro_actual = None
         self.filtro_elemento_actual = None
-        self.ultimo_timestamp = self.sistema.obtener_timestamp_modificacion()
         self.en_pagina = False
         self.ui_inicializada = False
+        self._recarga_programada = False
+        self._lock_recarga = threading.Lock()
+        self._eventos_pendientes = []
+        
+        # Filas dibujadas por id de alerta (para actualizar solo lo que cambia)
+        self._filas = {}
+        self._limite_filas = self.TAMANO_PAGINA
+        self._hay_mas = False
+        self._cargando_mas = False
         
         # Componentes UI
         self.punto_estado = ft.Container(
@@ -149,11 +581,21 @@ class AlertasView(ft.Container):
             expand=True,
             spacing=5,
             padding=10,
-            auto_scroll=False
+            auto_scroll=False,
+            on_scroll=self._on_scroll_lista
+        )
+        
+        self.btn_cargar_mas = ft.TextButton(
+            "Cargar más alertas",
+            icon=ft.Icons.EXPAND_MORE,
+            on_click=self.cargar_mas
         )
         
         # Construir UI
         self.build_ui()
+        
+        # Recibir los cambios del sistema en lugar de consultarlo periódicamente
+        self.sistema.suscribir(self._on_cambio_alertas)
     
     def build_ui(self):
         """Construye la interfaz de usuario"""
@@ -324,51 +766,42 @@ class AlertasView(ft.Container):
         self.ui_inicializada = True
         print("Entrando a página de Alertas")
         
-        # Cargar datos iniciales
+        # Cargar datos (los cambios mientras estábamos fuera se ven aquí)
         self.cargar_ui()
-        
-        # Iniciar verificación periódica
-        self.iniciar_verificacion()
     
     def salir_de_pagina(self):
         """Se llama cuando salimos de la página de alertas"""
+        if not self.en_pagina:
+            return
         self.en_pagina = False
         self.ui_inicializada = False
         print("Saliendo de página de Alertas")
     
-    def iniciar_verificacion(self):
-        """Inicia la verificación periódica de cambios"""
-        def verificar():
-            print("Iniciando verificación de cambios...")
-            
-            while self.en_pagina:
-                try:
-                    time.sleep(0.5)
-                    
-                    if not self.en_pagina:
-                        break
-                    
-                    timestamp_actual = self.sistema.obtener_timestamp_modificacion()
-                    
-                    if timestamp_actual > self.ultimo_timestamp:
-                        print(f"Cambio detectado! {self.ultimo_timestamp} -> {timestamp_actual}")
-                        self.ultimo_timestamp = timestamp_actual
-                        
-                        # Animación del puntito
-                        self.animar_puntito_seguro()
-                        
-                        # Actualizar UI
-                        if self.page and self.ui_inicializada:
-                            try:
-                                self.page.run_thread(self.actualizar_inmediato_seguro)
-                            except:
-                                pass
-                            
-                except Exception as e:
-                    print(f"Error en verificación: {e}")
-                    time.sleep(1)
+    # Ciclo de vida de página (UI.change_page_manual)
+    def activar(self):
+        self.entrar_a_pagina()
+    
+    def desactivar(self):
+        self.salir_de_pagina()
+    
+    def _on_cambio_alertas(self, evento, ids):
+        """Recibe los eventos de SistemaAlertas; solo refresca si la página está visible"""
+        if not self.en_pagina or not self.ui_inicializada or not self.page:
+            return
         
-        threading.Thread(target=verificar, daemon=True).start()
+        # Varias notificaciones seguidas se aplican juntas en el hilo de la UI
+        with self._lock_recarga:
+            self._eventos_pendientes.append((evento, ids))
+            if self._recarga_programada:
+                return
+            self._recarga_programada = True
+        
+        self.animar_puntito_seguro()
+        try:
+            self.page.run_thread(self.aplicar_cambios_seguro)
+        except Exception as e:
+            self._recarga_programada = False
+            print(f"Error programando actualización de alertas: {e}")
     
     def animar_puntito_seguro(self):
         """Hace parpadear el puntito verde de forma segura"""
@@ -376,51 +809,118 @@ class AlertasView(ft.Container):
             if not self.ui_inicializada or not self.page:
                 return
                 
-            def actualizar_ui():
-                try:
-                    self.punto_estado.opacity = 1
-                    self.punto_estado.bgcolor = ft.Colors.GREEN_500
-                    self.punto_estado.update()
-                except Exception as e:
-                    print(f"Error animando puntito: {e}")
-            
-            self.page.run_thread(actualizar_ui)
+            self.punto_estado.opacity = 1
+            self.punto_estado.bgcolor = ft.Colors.GREEN_500
+            programar_actualizacion(self.page, self.punto_estado)
 
             def desvanecer():
-                time.sleep(1)
                 if self.ui_inicializada and self.page:
-                    def desvanecer_ui():
-                        try:
-                            self.punto_estado.opacity = 0.5
-                            self.punto_estado.update()
-                        except Exception as e:
-                            print(f"Error desvaneciendo puntito: {e}")
-                    self.page.run_thread(desvanecer_ui)
+                    self.punto_estado.opacity = 0.5
+                    programar_actualizacion(self.page, self.punto_estado)
             
-            threading.Thread(target=desvanecer, daemon=True).start()
+            # Una ráfaga de cambios deja un solo desvanecido pendiente
+            rueda_ui.programar(1, desvanecer, clave=("puntito_alertas", id(self)))
         except Exception as e:
             print(f"Error en animar_puntito_seguro: {e}")
     
     def actualizar_inmediato_seguro(self):
         """Actualiza la UI inmediatamente de forma segura"""
+        with self._lock_recarga:
+            self._recarga_programada = False
+            self._eventos_pendientes = []
         try:
             self.cargar_ui()
         except Exception as e:
             print(f"Error al actualizar: {e}")
     
-    def cargar_ui(self, e=None):
-        """Carga las alertas en la interfaz"""
+    def aplicar_cambios_seguro(self):
+        """Aplica los eventos pendientes tocando solo las filas afectadas"""
+        with self._lock_recarga:
+            self._recarga_programada = False
+            eventos, self._eventos_pendientes = self._eventos_pendientes, []
+        
         try:
-            # Obtener alertas filtradas
-            alertas = self.sistema.obtener_alertas(self.filtro_actual, self.filtro_elemento_actual)
-            alertas.sort(key=lambda x: x.get("id", 0), reverse=True)
-            
-            # Limpiar y recrear la lista
-            nuevos_controles = []
-            for alerta in alertas:
-                nuevos_controles.append(self._crear_fila_alerta(alerta))
+            for evento, ids in eventos:
+                if evento == SistemaAlertas.EVENTO_LIMPIADAS:
+                    self.cargar_ui()
+                    return
+                for id_alerta in ids:
+                    if evento == SistemaAlertas.EVENTO_AGREGADA:
+                        self._insertar_fila(id_alerta)
+                    elif evento == SistemaAlertas.EVENTO_ACTUALIZADA:
+                        self._reemplazar_fila(id_alerta)
+                    elif evento == SistemaAlertas.EVENTO_ELIMINADA:
+                        self._quitar_fila(id_alerta)
             
-            self.lista_alertas.controls = nuevos_controles
+            self.actualizar_contador_seguro()
+            if self.ui_inicializada:
+                # Se envía junto con el resto de cambios del mismo cuadro
+                programar_actualizacion(self.page, self)
+        except Exception as e:
+            print(f"Error aplicando cambios de alertas: {e}")
+    
+    def _coincide_filtro(self, alerta):
+        if self.filtro_actual and alerta.get("pagina") != self.filtro_actual:
+            return False
+        if self.filtro_elemento_actual and alerta.get("elemento") != self.filtro_elemento_actual:
+            return False
+        return True
+    
+    def _insertar_fila(self, id_alerta):
+        """Agrega la fila de una alerta nueva arriba y recorta la más antigua si sobra"""
+        alerta = self.sistema.obtener_alerta(id_alerta)
+        if alerta is None or id_alerta in self._filas or not self._coincide_filtro(alerta):
+            return
+        fila = self._crear_fila_alerta(alerta)
+        self._filas[id_alerta] = fila
+        self.lista_alertas.controls.insert(0, fila)
+        
+        if len(self._filas) > self._limite_filas:
+            self._quitar_fila(min(self._filas))
+            self._mostrar_cargar_mas(True)
+    
+    def _reemplazar_fila(self, id_alerta):
+        fila = self._filas.get(id_alerta)
+        alerta = self.sistema.obtener_alerta(id_alerta)
+        if fila is None or alerta is None:
+            return
+        nueva = self._crear_fila_alerta(alerta)
+        controles = self.lista_alertas.controls
+        controles[controles.index(fila)] = nueva
+        self._filas[id_alerta] = nueva
+    
+    def _quitar_fila(self, id_alerta):
+        fila = self._filas.pop(id_alerta, None)
+        if fila is not None:
+            self.lista_alertas.controls.remove(fila)
+    
+    def _mostrar_cargar_mas(self, hay_mas):
+        self._hay_mas = hay_mas
+        controles = self.lista_alertas.controls
+        if hay_mas and self.btn_cargar_mas not in controles:
+            controles.append(self.btn_cargar_mas)
+        elif not hay_mas and self.btn_cargar_mas in controles:
+            controles.remove(self.btn_cargar_mas)
+    
+    def _agregar_pagina(self, antes_de_id=None):
+        """Dibuja la siguiente página de alertas al final de la lista"""
+        alertas = self.sistema.obtener_alertas_recientes(
+            self.TAMANO_PAGINA + 1, antes_de_id, self.filtro_actual, self.filtro_elemento_actual
+        )
+        self._mostrar_cargar_mas(False)
+        for alerta in alertas[:self.TAMANO_PAGINA]:
+            fila = self._crear_fila_alerta(alerta)
+            self._filas[alerta["id"]] = fila
+            self.lista_alertas.controls.append(fila)
+        self._mostrar_cargar_mas(len(alertas) > self.TAMANO_PAGINA)
+    
+    def cargar_ui(self, e=None):
+        """Carga la primera página de alertas en la interfaz"""
+        try:
+            self._filas = {}
+            self._limite_filas = self.TAMANO_PAGINA
+            self.lista_alertas.controls = []
+            self._agregar_pagina()
             
             # Actualizar contador
             self.actualizar_contador_seguro()
@@ -435,6 +935,30 @@ class AlertasView(ft.Container):
         except Exception as ex:
             print(f"Error al cargar UI: {ex}")
     
+    def cargar_mas(self, e=None):
+        """Agrega la siguiente página de alertas más antiguas"""
+        if not self._hay_mas or self._cargando_mas:
+            return
+        self._cargando_mas = True
+        try:
+            antes_de_id = min(self._filas) if self._filas else None
+            self._limite_filas += self.TAMANO_PAGINA
+            self._agregar_pagina(antes_de_id)
+            if self.ui_inicializada:
+                self.lista_alertas.update()
+        except Exception as ex:
+            print(f"Error cargando más alertas: {ex}")
+        finally:
+            self._cargando_mas = False
+    
+    def _on_scroll_lista(self, e):
+        """Carga otra página al acercarse al final de la lista"""
+        try:
+            if self._hay_mas and e.pixels >= e.max_scroll_extent - 100:
+                self.cargar_mas()
+        except Exception as ex:
+            print(f"Error en scroll de alertas: {ex}")
+    
     def _crear_fila_alerta(self, alerta):
         """Crea una fila de datos de alerta con información detallada"""
         causa = alerta.get("causa", "Sin causa")
@@ -443,16 +967,19 @@ class AlertasView(ft.Container):
         valor = alerta.get("valor", "N/A")
         alerta_id = alerta.get("id", "N/A")
         
-        # Obtener fecha y hora
-        fecha = alerta.get("fecha", "Fecha desconocida")
-        hora = alerta.get("hora", "Hora desconocida")
+        # Alertas repetidas (deduplicación): mostrar cuántas veces y la última vez
+        repeticiones = alerta.get("count", 1)
+        if repeticiones > 1:
+            causa = f"{causa} (x{repeticiones})"
         
-        # Formatear fecha como DD/MM/YY
-        try:
-            fecha_dt = datetime.datetime.strptime(fecha, "%Y-%m-%d")
-            fecha_formateada = fecha_dt.strftime("%d/%m/%y")
-        except:
-            fecha_formateada = fecha
+        # Formatear fecha (DD/MM/YY) y hora desde el timestamp
+        if "ts" in alerta:
+            momento = datetime.datetime.fromtimestamp(alerta.get("last_seen", alerta["ts"]))
+            fecha_formateada = momento.strftime("%d/%m/%y")
+            hora = momento.strftime("%H:%M")
+        else:
+            fecha_formateada = alerta.get("fecha", "Fecha desconocida")
+            hora = alerta.get("hora", "Hora desconocida")
         
         # Determinar color según tipo y gravedad
         tipo = alerta.get("tipo", "advertencia")
@@ -483,8 +1010,8 @@ class AlertasView(ft.Container):
         
         # Crear botón de eliminar
         def eliminar_click(e, id=alerta_id):
-            if self.eliminar_alerta(id):
-                self.cargar_ui()
+            # La lista se refresca con el evento "eliminada"
+            self.eliminar_alerta(id)
         
         btn_eliminar = ft.ElevatedButton(
             "Eliminar",
@@ -642,7 +1169,6 @@ class AlertasView(ft.Container):
         
         self.sistema.eliminar_todas_alertas()
         print("Todas las alertas eliminadas")
-        self.cargar_ui()
     
     def actualizar_contador_seguro(self):
         """Actualiza el contador de alertas de forma segura"""
@@ -668,9 +1194,3 @@ class AlertasView(ft.Container):
                     print(f"Error actualizando punto: {e}")
         except Exception as e:
             print(f"Error actualizando contador: {e}")
-
-# Función de compatibilidad
-def agregar_alerta(causa, pagina, elemento=None, valor=None, tipo=None):
-    """Función de compatibilidad para agregar alertas"""
-    sistema = SistemaAlertas()
-    return sistema.agregar_alerta(causa, pagina, elemento, valor, tipo)
\ No newline at end of file
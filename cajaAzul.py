@@ -1,5 +1,5 @@
 import flet as ft
-import time
+from temporizador import rueda_ui
 
 class BlueBox(ft.Container):
     def __init__(
@@ -141,11 +141,17 @@ class BlueBox(ft.Container):
     def Check_On_Click(self, e):
         self.btn_connect.scale = ft.Scale(0.90)
         self.btn_connect.update()
-        time.sleep(0.20)
-        self.btn_connect.scale = ft.Scale(1)
-        self.btn_connect.update()
+        # Volver al tamaño normal sin bloquear el manejador del click
+        rueda_ui.programar(0.20, self._restaurar_escala, clave=("escala_boton", id(self)))
         print(f"Botón de Check presionado - {self.texto_titulo.value}")
         
         # NUEVO: Llamar al callback si existe
         if self.on_grafica_click:
-            self.on_grafica_click(self.texto_titulo.value)
\ No newline at end of file
+            self.on_grafica_click(self.texto_titulo.value)
+
+    def _restaurar_escala(self):
+        try:
+            self.btn_connect.scale = ft.Scale(1)
+            self.btn_connect.update()
+        except Exception as ex:
+            print(f"BlueBox: Error restaurando botón: {ex}")
\ No newline at end of file
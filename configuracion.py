@@ -2,10 +2,15 @@ import flet as ft
 import datetime
 import json
 import os
-import pandas as pd
-import threading
-from collections import defaultdict
-import time
+from historial import formatear_ts
+from actualizaciones import programar_actualizacion
+from temporizador import rueda_ui
+
+MESES_ES = {
+    "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
+    "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
+    "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
+}
 
 class ConfiguracionContainer(ft.Container):
     def __init__(self, page=None, reloj_global=None, usuario_actual=None, rol_actual=None):
@@ -101,8 +106,9 @@ class ConfiguracionContainer(ft.Container):
         # Cargar horas desde el reloj global si existe
         self.actualizar_lista_horas()
         
-        # Iniciar solo la actualización de la hora visual
-        self.iniciar_actualizacion_hora_visual()
+        # La hora visual solo avanza mientras la página está visible (ver activar)
+        self.activa = False
+        self._historial_pendiente = False
         
         # Cargar historial de registros
         self.cargar_y_mostrar_historial()
@@ -267,100 +273,49 @@ class ConfiguracionContainer(ft.Container):
         """Carga y muestra el historial de registros organizado por mes"""
         self.historial_registros.controls.clear()
         
-        # Cargar historial desde el reloj global si existe
-        if self.reloj_global and hasattr(self.reloj_global, 'historial_registros'):
-            historial = self.reloj_global.historial_registros
-            
-            if not historial:
-                self.historial_registros.controls.append(
-                    ft.Container(
-                        padding=20,
-                        alignment=ft.alignment.center,
-                        content=ft.Text(
-                            "No hay registros en el historial",
-                            size=16,
-                            color=ft.Colors.GREY_500,
-                            italic=True
-                        )
-                    )
-                )
-                return
-            
-            # Agrupar registros por mes
-            registros_por_mes = self.agrupar_registros_por_mes(historial)
-            
-            if not registros_por_mes:
-                self.historial_registros.controls.append(
-                    ft.Container(
-                        padding=20,
-                        alignment=ft.alignment.center,
-                        content=ft.Text(
-                            "No hay registros en el historial",
-                            size=16,
-                            color=ft.Colors.GREY_500,
-                            italic=True
-                        )
-                    )
-                )
-                return
-            
-            # Crear una fila para cada mes
-            for mes_key, registros in registros_por_mes.items():
-                fila = self.crear_fila_mes(mes_key, registros)
-                self.historial_registros.controls.append(fila)
-
-    def agrupar_registros_por_mes(self, historial):
-        """Agrupa los registros por mes (YYYY-MM)"""
-        registros_por_mes = defaultdict(list)
-        
-        for registro in historial:
+        # Resumen por mes consultado al almacén del reloj global
+        resumen = {}
+        if self.reloj_global and hasattr(self.reloj_global, 'resumen_historial_por_mes'):
             try:
-                # Parsear fecha del registro
-                fecha_str = registro["fecha"]
-                # Formato: dd/mm/yy
-                dia, mes, anio = fecha_str.split('/')
-                anio_completo = f"20{anio}" if len(anio) == 2 else anio
-                
-                # Crear clave del mes (YYYY-MM)
-                mes_key = f"{anio_completo}-{mes.zfill(2)}"
-                
-                # Obtener nombre del mes en español
-                meses_es = {
-                    "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
-                    "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
-                    "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
-                }
-                nombre_mes = meses_es.get(mes, f"Mes {mes}")
-                
-                # Agregar registro al mes correspondiente
-                registros_por_mes[mes_key].append({
-                    "registro": registro,
-                    "nombre_mes": nombre_mes,
-                    "anio": anio_completo
-                })
+                resumen = self.reloj_global.resumen_historial_por_mes()
             except Exception as e:
-                print(f"Error procesando registro: {e}")
-                continue
+                print(f"Error obteniendo resumen del historial: {e}")
         
-        return dict(registros_por_mes)
+        if not resumen:
+            self.historial_registros.controls.append(
+                ft.Container(
+                    padding=20,
+                    alignment=ft.alignment.center,
+                    content=ft.Text(
+                        "No hay registros en el historial",
+                        size=16,
+                        color=ft.Colors.GREY_500,
+                        italic=True
+                    )
+                )
+            )
+            return
+        
+        # Crear una fila para cada mes
+        for mes_key, conteos in resumen.items():
+            fila = self.crear_fila_mes(mes_key, conteos)
+            self.historial_registros.controls.append(fila)
 
-    def crear_fila_mes(self, mes_key, registros_mes):
-        """Crea una fila para mostrar un mes con sus registros"""
+    def crear_fila_mes(self, mes_key, conteos):
+        """Crea una fila para mostrar un mes con sus contadores"""
         # Obtener información del mes
-        primer_registro = registros_mes[0]
-        nombre_mes = primer_registro["nombre_mes"]
-        anio = primer_registro["anio"]
+        anio, mes = mes_key.split('-')
+        nombre_mes = MESES_ES.get(mes, f"Mes {mes}")
         
-        # Contar registros por tipo
-        total_registros = len(registros_mes)
-        automaticos = sum(1 for r in registros_mes if r["registro"]["tipo"] == "registro_automatico")
-        manuales = sum(1 for r in registros_mes if r["registro"]["tipo"] == "registro_manual")
+        total_registros = conteos["total"]
+        automaticos = conteos["automaticos"]
+        manuales = conteos["manuales"]
         
         # Crear botón para descargar Excel del mes
         btn_descargar = ft.ElevatedButton(
             text=f"Descargar {nombre_mes} {anio}",
             icon=ft.Icons.DOWNLOAD,
-            on_click=lambda e, mes=mes_key, regs=registros_mes: self.descargar_excel_mes(mes, regs),
+            on_click=lambda e, mes=mes_key: self.descargar_excel_mes(mes),
             width=250,
             height=45,
             style=ft.ButtonStyle(
@@ -484,29 +439,25 @@ class ConfiguracionContainer(ft.Container):
         
         return fila
 
-    def descargar_excel_mes(self, mes_key, registros_mes):
+    def descargar_excel_mes(self, mes_key):
         """Descarga todos los registros de un mes como archivo Excel"""
         try:
             # Preparar datos para Excel
             datos_excel = []
             
-            for item in registros_mes:
-                registro = item["registro"]
+            # Consultar solo los registros del mes en el almacén del historial
+            registros = self.reloj_global.obtener_registros_mes(mes_key)
+            
+            # Ordenar por timestamp (los textos se generan solo para el archivo)
+            registros.sort(key=lambda r: r["ts"])
+            
+            for registro in registros:
                 datos = registro["datos"]
                 
-                # Convertir fecha al formato YYYY-MM-DD para ordenamiento
-                fecha_str = registro["fecha"]  # Formato: dd/mm/yy
-                hora_str = registro["hora"]     # Formato: HH:MM
-                
-                # Parsear fecha
-                dia, mes, anio = fecha_str.split('/')
-                anio_completo = f"20{anio}" if len(anio) == 2 else anio
-                fecha_iso = f"{anio_completo}-{mes.zfill(2)}-{dia.zfill(2)}"
-                
                 # Crear fila para Excel
                 fila_excel = {
-                    "Fecha": fecha_iso,
-                    "Hora": hora_str,
+                    "Fecha": formatear_ts(registro["ts"], "%Y-%m-%d"),
+                    "Hora": formatear_ts(registro["ts"], "%H:%M"),
                     "Tipo": "Automático" if registro["tipo"] == "registro_automatico" else "Manual",
                     "Fuente": registro.get("fuente", "Sistema"),
                     "Temperatura (°C)": datos.get('temperatura', '--'),
@@ -518,20 +469,14 @@ class ConfiguracionContainer(ft.Container):
                 
                 datos_excel.append(fila_excel)
             
-            # Ordenar por fecha y hora
-            datos_excel.sort(key=lambda x: (x["Fecha"], x["Hora"]))
-            
             # Crear DataFrame
+            # pandas solo se importa al exportar (tarda en cargar en los equipos lentos)
+            import pandas as pd
             df = pd.DataFrame(datos_excel)
             
             # Obtener información del mes
             anio, mes_num = mes_key.split('-')
-            meses_es = {
-                "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
-                "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
-                "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
-            }
-            nombre_mes = meses_es.get(mes_num, f"Mes_{mes_num}")
+            nombre_mes = MESES_ES.get(mes_num, f"Mes_{mes_num}")
             
             # Crear nombre de archivo
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1119,7 +1064,7 @@ class ConfiguracionContainer(ft.Container):
         )
         self.page.overlay.append(snack_bar)
         snack_bar.open = True
-        self.page.update()
+        programar_actualizacion(self.page)
 
 
     def cambiar_pestana(self, e):
@@ -1175,23 +1120,33 @@ class ConfiguracionContainer(ft.Container):
                 )
                 self.lista_horas.controls.append(fila)
 
+    def activar(self):
+        """La página se muestra: arrancar el reloj visual y ponerse al día"""
+        self.activa = True
+        self.iniciar_actualizacion_hora_visual()
+        if self._historial_pendiente:
+            self._historial_pendiente = False
+            self.actualizar_historial_desde_externo()
+    
+    def desactivar(self):
+        """La página se oculta: detener el reloj visual"""
+        self.activa = False
+        rueda_ui.cancelar(("hora_visual", id(self)))
+
     def iniciar_actualizacion_hora_visual(self):
-        """Solo actualiza la hora visual, no las alarmas"""
-        def actualizar_hora():
-            while True:
-                try:
-                    ahora = datetime.datetime.now()
-                    if self.page:
-                        def update_ui():
-                            self.texto_hora.value = ahora.strftime("%I:%M:%S %p")
-                            self.page.update()
-                        self.page.run_thread(update_ui)
-                    time.sleep(1)
-                except:
-                    break
-        
-        thread = threading.Thread(target=actualizar_hora, daemon=True)
-        thread.start()
+        """Solo actualiza la hora visual, no las alarmas (un tic por segundo en la rueda compartida)"""
+        if not self.activa:
+            return
+        ahora = datetime.datetime.now()
+        try:
+            if self.page:
+                self.texto_hora.value = ahora.strftime("%I:%M:%S %p")
+                programar_actualizacion(self.page, self.texto_hora)
+        except Exception as e:
+            print(f"Error actualizando hora visual: {e}")
+        # Próximo tic alineado al cambio de segundo
+        rueda_ui.programar(1 - ahora.microsecond / 1e6, self.iniciar_actualizacion_hora_visual,
+                           clave=("hora_visual", id(self)))
 
     def abrir_time_picker(self, e):
         if self.page:
@@ -1226,6 +1181,9 @@ class ConfiguracionContainer(ft.Container):
     # Nueva función para actualizar el historial desde fuera
     def actualizar_historial_desde_externo(self):
         """Actualiza el historial cuando se llama desde fuera"""
+        if not self.activa:
+            self._historial_pendiente = True
+            return
         if self.tabs.selected_index == 2:  # Si está en la pestaña de historial
             self.cargar_y_mostrar_historial()
             if self.page:
@@ -1,26 +1,73 @@
 
+import atexit
+import calendar
+import itertools
+import json
 import os
+import shutil
+import threading
+import time
 from datetime import datetime
-from openpyxl import load_workbook
+
+from parche_xlsm import escribir_celdas
 
 class ExcelUnicoArchivo:
-    def __init__(self):
-        """Inicializa la clase cargando el archivo una vez en memoria"""
-        # Ruta del archivo principal
-        carpeta_datos="C:/Users/luism/Desktop/Datos_Sistema_Monitoreo"
-        self.carpeta_datos = carpeta_datos
-        self.archivo = os.path.join(self.carpeta_datos, "Prueba.xlsm")
+    # Carpeta de datos: la indicada al crear la instancia, la variable de
+    # entorno MONITOREO_DATOS o la primera de CARPETAS_DATOS que exista
+    # (si ninguna existe se crea la última)
+    CARPETAS_DATOS = (
+        "C:/Users/luism/Desktop/Datos_Sistema_Monitoreo",
+        os.path.join(os.path.expanduser("~"), "Datos_Sistema_Monitoreo"),
+    )
+    # Un libro por período ("anual" o "mensual"), creado desde la plantilla
+    # al llegar la primera lectura del período: Monitoreo_2026.xlsm, Monitoreo_2026_03.xlsm
+    ROTACION = "anual"
+    NOMBRE_LIBRO = "Monitoreo"
+    PLANTILLA = "Plantilla.xlsm"
+    # Libro único de versiones anteriores; queda como archivo de sus datos y,
+    # si no hay otra plantilla, los libros nuevos se copian de él sin datos
+    PLANTILLA_ANTERIOR = "Prueba.xlsm"
+    # Segundos que una escritura espera a que termine la carga en segundo plano
+    ESPERA_CARGA = 120
+    # Cada lectura se anota primero en un diario JSONL junto al libro (con
+    # fsync); el hilo de consolidación la pasa al libro ESPERA_CONSOLIDACION
+    # segundos después de la primera pendiente, al cerrar o con consolidar(),
+    # y luego deja en el diario solo las lecturas que siguen pendientes.
+    # Si el archivo está bloqueado (abierto en Excel) se reintenta con espera creciente
+    SUFIJO_DIARIO = ".diario.jsonl"
+    # Lecturas que no se pudieron escribir en el libro (ver reintentar_fallidas)
+    SUFIJO_FALLIDAS = ".fallidas.jsonl"
+    ESPERA_CONSOLIDACION = 30.0
+    REINTENTO_INICIAL = 5.0
+    REINTENTO_MAXIMO = 300.0
+    # Avisar cuando a la tabla de un mes le queden estas filas o menos
+    AVISO_FILAS_RESTANTES = 3
+    # Columnas de cada lectura en los bloques de la plantilla ("hora": None
+    # deja la plantilla como estaba: solo fecha y valor)
+    COLUMNAS_PLANTILLA = {"fecha": "A", "hora": None, "valor": "D"}
+    # Cuando el bloque del mes no alcanza (varias lecturas por día) las
+    # lecturas van a una hoja de detalle por parámetro, con un bloque por mes
+    # de días * lecturas por día filas a partir de FILA_INICIO_DETALLE
+    HOJA_DETALLE = "{} detalle"
+    COLUMNAS_DETALLE = {"fecha": "A", "hora": "B", "valor": "C"}
+    FILA_INICIO_DETALLE = 3
+    # Guardar la cola parchando solo las hojas afectadas del .xlsm (ver
+    # parche_xlsm); si el libro no lo admite se guarda completo con openpyxl
+    ESCRITURA_DIRECTA = True
+
+    def __init__(self, carpeta_datos=None, precargar=True, archivo_diario=None, rotacion=None,
+                 lecturas_por_dia=1):
+        """Inicializa la clase; el libro del período actual se carga una vez en memoria en segundo plano"""
+        # Carpeta de datos y libro del período actual
+        self.carpeta_datos = self._elegir_carpeta(carpeta_datos)
+        self.rotacion = rotacion or self.ROTACION
+        self.lecturas_por_dia = max(1, lecturas_por_dia)
+        self.periodo = self._periodo(datetime.now())
+        self.archivo = self._ruta_libro(self.periodo)
         
         print(f"Usando: {self.archivo}")
 
-        self.bandera_archivo = True
-
-        # self.archivo = os.path.join(carpeta_datos, "Prueba.xlsm")
-        # print(f"📝 Usando: {os.path.basename(self.archivo)}")
-        
-        if not os.path.exists(self.archivo):
-            self.bandera_archivo = False
-            # raise FileNotFoundError(f"No se encuentra: {self.archivo}")
+        self.bandera_archivo = os.path.exists(self.archivo) or self._ruta_plantilla() is not None
         
         # Parámetros para las hojas (AJUSTA los nombres si son diferentes)
         self.parametros = {
@@ -56,57 +103,615 @@ class ExcelUnicoArchivo:
             12: (367, 396)  # Diciembre
         }
         
-        # Cargar el libro UNA VEZ al iniciar
+        # Cargar el libro UNA VEZ, sin bloquear el arranque de la interfaz
+        self.wb = None
+        self.tiempo_carga = None
+        # Siguiente fila libre por (hoja, mes); se calcula al cargar el libro
+        self._cursores = {}
+        self._lecturas_detalle = {}
+        # Hay cambios que la escritura directa no cubre (p. ej. una hoja nueva)
+        self._guardado_completo = False
+        self._libro_listo = threading.Event()
+        # Un solo hilo a la vez modifica o guarda el libro
+        self._lock_libro = threading.Lock()
+        if precargar:
+            threading.Thread(target=self._cargar_libro, name="ExcelPrecarga", daemon=True).start()
+        else:
+            self._cargar_libro()
+        
+        # Lecturas del diario sin consolidar: [{"n", "ts", "datos", "encolada"}];
+        # las primeras self._aplicadas ya están en memoria pero falta guardarlas
+        self.archivo_diario = archivo_diario or self._ruta_diario()
+        self.archivo_fallidas = os.path.join(os.path.dirname(self.archivo_diario), self.NOMBRE_LIBRO + self.SUFIJO_FALLIDAS)
+        self._condicion = threading.Condition()
+        self._proximo_n = 1
+        self._cola = self._cargar_diario()
+        self._importar_pendientes_anteriores()
+        self._aplicadas = 0
+        # Celdas escritas en memoria que faltan en el archivo: {hoja: {fila: {columna: valor}}}
+        self._celdas_sin_guardar = {}
+        self._reintento = 0.0
+        self._reintentar_en = 0.0
+        self._activo = True
+        self.estadisticas_escritura = {
+            "guardados": 0,
+            "fallos": 0,
+            "lecturas": 0,
+            "ultimo_guardado_ms": None,
+            "ultima_latencia_s": None,
+            "max_latencia_s": 0.0,
+        }
+        self._hilo_escritura = threading.Thread(target=self._loop_escritura, name="ExcelEscritura", daemon=True)
+        self._hilo_escritura.start()
+        atexit.register(self.cerrar)
+    
+    # ---------- LIBROS POR PERÍODO ----------
+    
+    def _elegir_carpeta(self, carpeta_datos):
+        """Resuelve la carpeta de datos y la crea si hace falta"""
+        carpeta = carpeta_datos or os.environ.get("MONITOREO_DATOS")
+        if not carpeta:
+            carpeta = next((c for c in self.CARPETAS_DATOS if os.path.isdir(c)), self.CARPETAS_DATOS[-1])
         try:
+            os.makedirs(carpeta, exist_ok=True)
+        except OSError as e:
+            print(f"❌ No se pudo crear la carpeta de datos {carpeta}: {e}")
+        return carpeta
+    
+    def _periodo(self, momento):
+        """Período al que pertenece una lectura: (año,) o (año, mes)"""
+        if self.rotacion == "mensual":
+            return (momento.year, momento.month)
+        return (momento.year,)
+    
+    def _ruta_libro(self, periodo):
+        sufijo = "_".join(f"{parte:02d}" for parte in periodo)
+        return os.path.join(self.carpeta_datos, f"{self.NOMBRE_LIBRO}_{sufijo}.xlsm")
+    
+    def _ruta_plantilla(self):
+        """Plantilla para los libros nuevos (None si no hay)"""
+        for nombre in (self.PLANTILLA, self.PLANTILLA_ANTERIOR):
+            ruta = os.path.join(self.carpeta_datos, nombre)
+            if os.path.exists(ruta):
+                return ruta
+        return None
+    
+    def _crear_libro(self, ruta):
+        """Crea el libro de un período desde la plantilla.
+        
+        El libro único anterior (PLANTILLA_ANTERIOR) siempre se copia sin los
+        datos: sus filas pueden ser de otro año y los cursores las saltarían,
+        mezclando ambos años en los mismos bloques. Sus datos quedan en él.
+        """
+        plantilla = self._ruta_plantilla()
+        if plantilla is None:
+            raise FileNotFoundError(f"No hay plantilla ({self.PLANTILLA}) en {self.carpeta_datos}")
+        if os.path.basename(plantilla) == self.PLANTILLA_ANTERIOR:
+            self._copiar_sin_datos(plantilla, ruta)
+            print(f"📗 Libro nuevo creado desde {self.PLANTILLA_ANTERIOR} sin sus datos: {os.path.basename(ruta)} "
+                  f"(guarde una copia vacía como {self.PLANTILLA})")
+            return
+        shutil.copy2(plantilla, ruta)
+        print(f"📗 Libro nuevo creado desde {os.path.basename(plantilla)}: {os.path.basename(ruta)}")
+    
+    def _copiar_sin_datos(self, plantilla, ruta):
+        """Copia la plantilla vaciando los bloques de cada mes y quitando las hojas de detalle"""
+        from openpyxl import load_workbook
+        wb = load_workbook(plantilla, keep_vba=True, data_only=False)
+        try:
+            columnas = [c for c in self.COLUMNAS_PLANTILLA.values() if c]
+            for nombre_base in self.hojas.values():
+                if nombre_base in wb.sheetnames:
+                    ws = wb[nombre_base]
+                    for inicio, fin in self.posiciones_mes.values():
+                        for fila in range(inicio, fin + 1):
+                            for columna in columnas:
+                                ws[f'{columna}{fila}'].value = None
+                detalle = self.HOJA_DETALLE.format(nombre_base)
+                for nombre in [n for n in wb.sheetnames if n.startswith(detalle)]:
+                    wb.remove(wb[nombre])
+            # Se escribe completo antes de darle el nombre final
+            temporal = ruta + ".tmp"
+            wb.save(temporal)
+            os.replace(temporal, ruta)
+        finally:
+            wb.close()
+    
+    def _abrir_periodo(self, periodo):
+        """Cambia al libro de otro período; requiere self._lock_libro y que no haya nada sin guardar"""
+        anterior = self.wb
+        self.wb = None
+        self._libro_listo.clear()
+        self._cargar_libro(periodo)
+        if self.wb is None:
+            return False
+        if anterior is not None:
+            anterior.close()
+        return True
+    
+    def _cargar_libro(self, periodo=None):
+        """Importa openpyxl y carga el libro del período (openpyxl solo se importa aquí)"""
+        inicio = time.perf_counter()
+        try:
+            if periodo is not None:
+                self.periodo = periodo
+                self.archivo = self._ruta_libro(periodo)
+            if not os.path.exists(self.archivo):
+                self._crear_libro(self.archivo)
+            self.bandera_archivo = True
+            from openpyxl import load_workbook
             self.wb = load_workbook(self.archivo, keep_vba=True, data_only=False)
-            print(f"📘 Libro cargado en memoria: {os.path.basename(self.archivo)}")
+            self._construir_cursores()
+            self.tiempo_carga = time.perf_counter() - inicio
+            print(f"📘 Libro cargado en memoria: {os.path.basename(self.archivo)} ({self.tiempo_carga * 1000:.0f} ms)")
         except Exception as e:
             print(f"Error al cargar el archivo: {e}")
+        finally:
+            self._libro_listo.set()
     
-    def _buscar_fila_vacia(self, ws, mes):
-        """Busca la primera fila vacía en el rango del mes especificado"""
-        if mes not in self.posiciones_mes:
+    def esperar_libro(self, timeout=None):
+        """Espera a que termine la precarga; devuelve True si el libro está en memoria"""
+        self._libro_listo.wait(self.ESPERA_CARGA if timeout is None else timeout)
+        return self.wb is not None
+    
+    # ---------- COLA DE ESCRITURA ----------
+    
+    def _ruta_diario(self):
+        """El diario va junto a los libros; si esa carpeta no existe, en la carpeta actual"""
+        nombre = self.NOMBRE_LIBRO + self.SUFIJO_DIARIO
+        carpeta = self.carpeta_datos if os.path.isdir(self.carpeta_datos) else os.getcwd()
+        if carpeta != self.carpeta_datos:
+            print(f"⚠️ No existe {self.carpeta_datos}, el diario de lecturas se guarda en {carpeta}")
+        ruta = os.path.join(carpeta, nombre)
+        # El diario se llamaba como el libro único anterior
+        anterior = os.path.join(carpeta, os.path.splitext(self.PLANTILLA_ANTERIOR)[0] + self.SUFIJO_DIARIO)
+        if os.path.exists(anterior) and not os.path.exists(ruta):
+            os.replace(anterior, ruta)
+        return ruta
+    
+    def _cargar_diario(self):
+        """Lee el diario y devuelve las lecturas que aún no se consolidaron en el libro"""
+        lecturas = {}
+        consolidadas = False
+        if os.path.exists(self.archivo_diario):
+            try:
+                linea = ""
+                with open(self.archivo_diario, "r", encoding='utf-8') as f:
+                    for linea in f:
+                        try:
+                            entrada = json.loads(linea)
+                        except ValueError:
+                            # Línea a medio escribir por un corte: se descarta
+                            continue
+                        if "n" in entrada:
+                            lecturas[entrada["n"]] = entrada
+                            self._proximo_n = max(self._proximo_n, entrada["n"] + 1)
+                        elif "consolidadas_hasta" in entrada:
+                            consolidadas = True
+                            for n in [n for n in lecturas if n <= entrada["consolidadas_hasta"]]:
+                                del lecturas[n]
+                # Con marcas de consolidación (versión anterior o compactación fallida) se compacta
+                compactado = consolidadas and self._compactar_diario([lecturas[n] for n in sorted(lecturas)])
+                if not compactado and linea and not linea.endswith("\n"):
+                    # Cerrar la línea cortada para que la próxima anotación empiece limpia
+                    with open(self.archivo_diario, "a", encoding='utf-8') as f:
+                        f.write("\n")
+            except Exception as e:
+                print(f"❌ Error leyendo el diario de lecturas: {e}")
+        
+        ahora = time.monotonic()
+        pendientes = [dict(lecturas[n], encolada=ahora) for n in sorted(lecturas)]
+        if pendientes:
+            print(f"📥 {len(pendientes)} lecturas del diario pendientes de consolidar en Excel")
+        return pendientes
+    
+    def _importar_pendientes_anteriores(self, archivo="excel_pendientes.json"):
+        """Pasa al diario la cola que guardaban las versiones anteriores"""
+        if not os.path.exists(archivo):
+            return
+        try:
+            with open(archivo, "r", encoding='utf-8') as f:
+                anteriores = json.load(f)
+            for lectura in anteriores:
+                self.encolar_lecturas(lectura["datos"], datetime.fromisoformat(lectura["ts"]))
+            os.remove(archivo)
+            print(f"📥 {len(anteriores)} lecturas de {archivo} pasadas al diario")
+        except Exception as e:
+            print(f"❌ Error importando {archivo}: {e}")
+    
+    def _anotar_diario(self, entrada, archivo=None):
+        """Agrega una línea al diario (u otro archivo JSONL) y la fuerza a disco"""
+        try:
+            with open(archivo or self.archivo_diario, "a", encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            return True
+        except Exception as e:
+            print(f"❌ Error escribiendo el diario de lecturas: {e}")
+            return False
+    
+    def encolar_lecturas(self, datos, momento=None):
+        """Anota un juego de lecturas en el diario y lo deja pendiente de consolidar"""
+        momento = momento or datetime.now()
+        with self._condicion:
+            lectura = {"n": self._proximo_n, "ts": momento.isoformat(timespec="seconds"), "datos": dict(datos)}
+            self._proximo_n += 1
+            guardada = self._anotar_diario(lectura)
+            lectura["encolada"] = time.monotonic()
+            self._cola.append(lectura)
+            self._condicion.notify()
+        return guardada
+    
+    def reintentar_fallidas(self):
+        """Vuelve a encolar las lecturas apartadas en el archivo de fallidas"""
+        with self._condicion:
+            if not os.path.exists(self.archivo_fallidas):
+                return 0
+            try:
+                fallidas = []
+                with open(self.archivo_fallidas, "r", encoding='utf-8') as f:
+                    for linea in f:
+                        try:
+                            fallidas.append(json.loads(linea))
+                        except ValueError:
+                            continue
+                for lectura in fallidas:
+                    self.encolar_lecturas(lectura["datos"], datetime.fromisoformat(lectura["ts"]))
+                os.remove(self.archivo_fallidas)
+            except Exception as e:
+                print(f"❌ Error reintentando lecturas fallidas: {e}")
+                return 0
+        print(f"📥 {len(fallidas)} lecturas fallidas encoladas de nuevo")
+        return len(fallidas)
+    
+    def pendientes_escritura(self):
+        """Cantidad de juegos de lecturas que aún no están guardados en el archivo"""
+        with self._condicion:
+            return len(self._cola)
+    
+    def _loop_escritura(self):
+        """Hilo que consolida en el libro las lecturas del diario"""
+        while True:
+            with self._condicion:
+                while self._activo:
+                    ahora = time.monotonic()
+                    if self._cola:
+                        vence = max(self._cola[0]["encolada"] + self.ESPERA_CONSOLIDACION, self._reintentar_en)
+                        if vence <= ahora:
+                            break
+                        self._condicion.wait(vence - ahora)
+                    else:
+                        self._condicion.wait()
+                if not self._activo:
+                    return
+            self._escribir_cola()
+    
+    def _escribir_cola(self):
+        """Consolida las lecturas pendientes, un tramo por cada libro de período"""
+        while True:
+            consolidadas = self._consolidar_tramo()
+            if consolidadas is None:
+                return False
+            if not consolidadas:
+                return True
+    
+    def _consolidar_tramo(self):
+        """Escribe en memoria las lecturas pendientes del mismo período, guarda una vez y lo marca
+        en el diario. Devuelve cuántas consolidó (None si falló)"""
+        if not self.esperar_libro():
+            # El libro no pudo cargarse (p. ej. no existe aún): intentar de nuevo más tarde
+            self._libro_listo.clear()
+            self._programar_reintento("el libro no está cargado")
+            self._cargar_libro()
             return None
+        
+        with self._lock_libro:
+            with self._condicion:
+                lote = list(self._cola)
+                aplicadas = self._aplicadas
+            if not lote:
+                return 0
+            # Las lecturas de otro período van a su propio libro en el siguiente tramo
+            periodo = self._periodo(datetime.fromisoformat(lote[0]["ts"]))
+            lote = list(itertools.takewhile(
+                lambda l: self._periodo(datetime.fromisoformat(l["ts"])) == periodo, lote
+            ))
+            if periodo != self.periodo and not self._abrir_periodo(periodo):
+                self._programar_reintento(f"no se pudo abrir {os.path.basename(self._ruta_libro(periodo))}")
+                return None
+            for lectura in lote[aplicadas:]:
+                momento = datetime.fromisoformat(lectura["ts"])
+                fallidos = {
+                    parametro: valor for parametro, valor in lectura["datos"].items()
+                    if not self.guardar_dato(parametro, valor, momento, self._celdas_sin_guardar)
+                }
+                if fallidos:
+                    # Se apartan antes de marcar el tramo como consolidado para no perderlas
+                    lectura["fallida"] = True
+                    self._anotar_diario({"n": lectura["n"], "ts": lectura["ts"], "datos": fallidos,
+                                         "motivo": "no se pudo escribir en el libro"}, self.archivo_fallidas)
+            # Ya están en memoria: si el guardado falla no se vuelven a escribir
+            with self._condicion:
+                self._aplicadas = len(lote)
+            
+            inicio = time.perf_counter()
+            try:
+                self._guardar_archivo()
+            except Exception as e:
+                self._programar_reintento(e)
+                return None
+            duracion = time.perf_counter() - inicio
             
+            latencia = time.monotonic() - lote[0]["encolada"]
+            fallidas = sum(1 for lectura in lote if lectura.get("fallida"))
+            with self._condicion:
+                del self._cola[:len(lote)]
+                if not self._compactar_diario(self._cola):
+                    self._anotar_diario({"consolidadas_hasta": lote[-1]["n"], "ts": datetime.now().isoformat(timespec="seconds")})
+                self._aplicadas = 0
+                self._reintento = 0.0
+                self._reintentar_en = 0.0
+                estadisticas = self.estadisticas_escritura
+                estadisticas["guardados"] += 1
+                estadisticas["lecturas"] += len(lote) - fallidas
+                estadisticas["fallos"] += fallidas
+                estadisticas["ultimo_guardado_ms"] = duracion * 1000
+                estadisticas["ultima_latencia_s"] = latencia
+                estadisticas["max_latencia_s"] = max(estadisticas["max_latencia_s"], latencia)
+        print(f"✅ {len(lote) - fallidas} lecturas guardadas en {os.path.basename(self.archivo)} "
+              f"(guardado {duracion * 1000:.0f} ms, latencia {latencia:.1f} s)")
+        if fallidas:
+            print(f"⚠️ {fallidas} lecturas no se pudieron escribir, quedan en {self.archivo_fallidas}")
+        return len(lote)
+    
+    def _compactar_diario(self, pendientes):
+        """Reescribe el diario solo con las lecturas pendientes (temporal con fsync y
+        reemplazo atómico) para que no crezca ni haya que releerlo entero al arrancar;
+        con el hilo de escritura en marcha requiere self._condicion"""
+        temporal = self.archivo_diario + ".tmp"
+        try:
+            with open(temporal, "w", encoding='utf-8') as f:
+                for lectura in pendientes:
+                    entrada = {"n": lectura["n"], "ts": lectura["ts"], "datos": lectura["datos"]}
+                    f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.archivo_diario)
+            return True
+        except Exception as e:
+            print(f"❌ Error compactando el diario de lecturas: {e}")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return False
+    
+    def _guardar_archivo(self):
+        """Lleva al archivo lo escrito en memoria; requiere self._lock_libro"""
+        if self.ESCRITURA_DIRECTA and self._celdas_sin_guardar and not self._guardado_completo:
+            try:
+                escribir_celdas(self.archivo, self._celdas_sin_guardar)
+                self._celdas_sin_guardar = {}
+                return
+            except ValueError as e:
+                print(f"⚠️ Escritura directa no disponible ({e}), se guarda el libro completo")
+        self.wb.save(self.archivo)
+        self._celdas_sin_guardar = {}
+        self._guardado_completo = False
+    
+    def _programar_reintento(self, motivo):
+        """Espera creciente antes del próximo intento (archivo bloqueado, ausente...)"""
+        with self._condicion:
+            self._reintento = min(self._reintento * 2 or self.REINTENTO_INICIAL, self.REINTENTO_MAXIMO)
+            self._reintentar_en = time.monotonic() + self._reintento
+            self.estadisticas_escritura["fallos"] += 1
+            pendientes = len(self._cola)
+        print(f"⚠️ No se pudo guardar el libro ({motivo}); {pendientes} lecturas en cola, "
+              f"reintento en {self._reintento:.0f} s")
+    
+    def obtener_estadisticas_escritura(self):
+        """Guardados, fallos y latencias de la escritura en segundo plano"""
+        with self._condicion:
+            return dict(self.estadisticas_escritura, pendientes=len(self._cola))
+    
+    def consolidar(self):
+        """Pasa al libro de inmediato las lecturas pendientes del diario"""
+        with self._condicion:
+            hay_pendientes = bool(self._cola)
+        if hay_pendientes:
+            return self._escribir_cola()
+        return True
+    
+    def cerrar(self):
+        """Detiene el hilo de escritura e intenta guardar lo pendiente"""
+        with self._condicion:
+            if not self._activo:
+                return
+            self._activo = False
+            self._condicion.notify_all()
+        self._hilo_escritura.join(timeout=5)
+        if self._libro_listo.is_set():
+            self.consolidar()
+    
+    def _construir_cursores(self):
+        """Recorre el libro una vez y ubica la siguiente fila libre de cada hoja y mes"""
+        self._cursores = {}
+        self._lecturas_detalle = {}
+        for nombre_base in self.hojas.values():
+            detalle = self.HOJA_DETALLE.format(nombre_base)
+            for nombre_hoja in self.wb.sheetnames:
+                if nombre_hoja != nombre_base and not nombre_hoja.startswith(detalle):
+                    continue
+                ws = self.wb[nombre_hoja]
+                for mes in self.posiciones_mes:
+                    self._cursores[(nombre_hoja, mes)] = self._fin_de_datos(ws, self._bloque(nombre_hoja, mes))
+    
+    def _fin_de_datos(self, ws, bloque):
+        """Fila siguiente a la última con fecha en la columna A del bloque.
+        
+        Una fila vaciada a mano en medio del mes no se reutiliza: los datos
+        siguen después de la última fila escrita.
+        """
+        inicio, fin = bloque
+        siguiente = inicio
+        filas = ws.iter_rows(min_row=inicio, max_row=fin, min_col=1, max_col=1, values_only=True)
+        for fila, (valor,) in enumerate(filas, start=inicio):
+            if valor is not None:
+                siguiente = fila + 1
+        return siguiente
+    
+    def _bloque(self, nombre_hoja, mes):
+        """Filas (inicio, fin) del mes en una hoja de la plantilla o de detalle"""
+        if nombre_hoja in self.hojas.values():
+            return self.posiciones_mes[mes]
+        # Hoja de detalle: cada mes ocupa sus días * lecturas por día de la hoja
+        lecturas = self._lecturas_hoja_detalle(nombre_hoja)
+        anio = self.periodo[0]
+        dias_previos = sum(calendar.monthrange(anio, m)[1] for m in range(1, mes))
+        inicio = self.FILA_INICIO_DETALLE + dias_previos * lecturas
+        return inicio, inicio + calendar.monthrange(anio, mes)[1] * lecturas - 1
+    
+    def _lecturas_hoja_detalle(self, nombre_hoja):
+        """Lecturas por día con que se dimensionó la hoja de detalle (celda B1)"""
+        if nombre_hoja not in self._lecturas_detalle:
+            valor = self.wb[nombre_hoja]['B1'].value
+            self._lecturas_detalle[nombre_hoja] = int(valor) if isinstance(valor, (int, float)) and valor >= 1 else 1
+        return self._lecturas_detalle[nombre_hoja]
+    
+    def _hoja_detalle(self, nombre_hoja, numero=1):
+        """Nombre de la hoja de detalle número `numero` del parámetro; la crea si no existe"""
+        nombre = self.HOJA_DETALLE.format(nombre_hoja)
+        if numero > 1:
+            nombre = f"{nombre} {numero}"
+        if nombre not in self.wb.sheetnames:
+            ws = self.wb.create_sheet(nombre)
+            ws['A1'].value = "Lecturas por día"
+            ws['B1'].value = self.lecturas_por_dia
+            for columna, titulo in (('A', "Fecha"), ('B', "Hora"), ('C', "Valor")):
+                ws[f'{columna}2'].value = titulo
+            # La escritura directa no agrega hojas: el próximo guardado es completo
+            self._guardado_completo = True
+            print(f"📄 Hoja {nombre} creada para {self.lecturas_por_dia} lecturas por día")
+        return nombre
+    
+    def _fila_en_detalle(self, nombre_base, mes):
+        """Hoja de detalle y fila libre para una lectura del mes.
+        
+        Se usa la primera hoja de detalle dimensionada para las lecturas por
+        día actuales con lugar en el bloque del mes; si ninguna lo tiene (la
+        frecuencia subió o el bloque se llenó) se crea la siguiente.
+        Devuelve (nombre_hoja, fila) o (nombre_hoja, None) si ni una hoja nueva alcanza.
+        """
+        numero = 1
+        while True:
+            nombre = self.HOJA_DETALLE.format(nombre_base) + (f" {numero}" if numero > 1 else "")
+            nueva = nombre not in self.wb.sheetnames
+            if nueva:
+                self._hoja_detalle(nombre_base, numero)
+            if self._lecturas_hoja_detalle(nombre) >= self.lecturas_por_dia:
+                fila = self._buscar_fila_vacia(self.wb[nombre], nombre, mes)
+                if fila is not None or nueva:
+                    return nombre, fila
+            numero += 1
+    
+    def _cabe_en_plantilla(self, anio, mes):
+        """Si el bloque del mes en la plantilla alcanza para las lecturas configuradas.
+        
+        Con una lectura diaria se usa siempre la plantilla (está pensada para
+        eso); el día que no quepa pasa a la hoja de detalle.
+        """
+        if self.lecturas_por_dia <= 1:
+            return True
         inicio, fin = self.posiciones_mes[mes]
+        return calendar.monthrange(anio, mes)[1] * self.lecturas_por_dia <= fin - inicio + 1
+    
+    def configurar_lecturas_por_dia(self, lecturas_por_dia):
+        """Ajusta la capacidad esperada (una lectura por alarma de horas.json)"""
+        lecturas_por_dia = max(1, int(lecturas_por_dia))
+        if lecturas_por_dia == self.lecturas_por_dia:
+            return
+        self.lecturas_por_dia = lecturas_por_dia
+        anio = self.periodo[0]
+        desbordados = [mes for mes in self.posiciones_mes if not self._cabe_en_plantilla(anio, mes)]
+        if desbordados:
+            print(f"📐 {lecturas_por_dia} lecturas por día no caben en los bloques de la plantilla: "
+                  f"los meses se escriben en las hojas '{self.HOJA_DETALLE.format('...')}'")
+        else:
+            print(f"📐 {lecturas_por_dia} lecturas por día caben en la plantilla")
+    
+    def _buscar_fila_vacia(self, ws, nombre_hoja, mes):
+        """Siguiente fila libre del mes según el cursor (None si la tabla está llena)"""
+        if mes not in self.posiciones_mes:
+            return None
         
-        # Buscar fila vacía en la columna A
-        for fila in range(inicio, fin + 1):
-            if ws[f'A{fila}'].value is None:
-                return fila
+        bloque = self._bloque(nombre_hoja, mes)
+        clave = (nombre_hoja, mes)
+        if clave not in self._cursores:
+            self._cursores[clave] = self._fin_de_datos(ws, bloque)
+        fila = self._cursores[clave]
         
-        return None
+        return fila if fila <= bloque[1] else None
     
-    def guardar_dato(self, parametro, valor):
-        """Guarda un dato en la plantilla .xlsm (solo en memoria)"""
+    def guardar_dato(self, parametro, valor, momento=None, celdas=None):
+        """Guarda un dato en la plantilla .xlsm (solo en memoria).
+        
+        Va al bloque del mes en la hoja del parámetro; si no alcanza para las
+        lecturas por día configuradas (o se llenó), a su hoja de detalle.
+        Si se pasa `celdas`, anota ahí lo escrito para la escritura directa.
+        """
         try:
             if parametro not in self.hojas:
                 print(f"❌ Parámetro no válido: {parametro}")
                 return False
             
             # Acceder a la hoja ya cargada en memoria
-            ws = self.wb[self.hojas[parametro]]
+            if not self.esperar_libro():
+                print("❌ El libro no está cargado")
+                return False
+            nombre_hoja = self.hojas[parametro]
+            ws = self.wb[nombre_hoja]
             
-            # Obtener fecha actual
-            fecha_completa = datetime.now()
+            # Fecha de la lectura (la actual si no se indica)
+            fecha_completa = momento or datetime.now()
             fecha_solo = fecha_completa.date()  # Solo la parte de la fecha
             mes = fecha_completa.month
             
-            # Buscar fila vacía para este mes
-            fila = self._buscar_fila_vacia(ws, mes)
+            # Buscar fila vacía para este mes (en la plantilla o en la hoja de detalle)
+            columnas = self.COLUMNAS_PLANTILLA
+            fila = None
+            if self._cabe_en_plantilla(fecha_completa.year, mes):
+                fila = self._buscar_fila_vacia(ws, nombre_hoja, mes)
+            if fila is None and self.HOJA_DETALLE:
+                nombre_hoja, fila = self._fila_en_detalle(nombre_hoja, mes)
+                ws = self.wb[nombre_hoja]
+                columnas = self.COLUMNAS_DETALLE
             
             if fila is None:
-                print(f"⚠️ Tabla llena para mes {mes} en hoja {self.hojas[parametro]}")
+                print(f"⚠️ Tabla llena para mes {mes} en hoja {nombre_hoja}")
                 return False
             
-            # Escribir fecha (como datetime)
-            ws[f'A{fila}'].value = fecha_solo
-            ws[f'A{fila}'].number_format = 'DD-MMM-YYYY'
+            # Escribir fecha, hora (si la distribución la tiene) y valor
+            escritas = {}
+            for campo, dato, formato in (
+                ("fecha", fecha_solo, 'DD-MMM-YYYY'),
+                ("hora", fecha_completa.time().replace(microsecond=0), 'HH:MM'),
+                ("valor", valor, None),
+            ):
+                columna = columnas.get(campo)
+                if columna is None:
+                    continue
+                ws[f'{columna}{fila}'].value = dato
+                if formato:
+                    ws[f'{columna}{fila}'].number_format = formato
+                escritas[columna] = dato
+            self._cursores[(nombre_hoja, mes)] = fila + 1
+            if celdas is not None:
+                celdas.setdefault(nombre_hoja, {})[fila] = escritas
             
-            # Escribir valor en columna D (como número)
-            ws[f'D{fila}'].value = valor
+            restantes = self._bloque(nombre_hoja, mes)[1] - fila
+            if restantes <= self.AVISO_FILAS_RESTANTES:
+                print(f"⚠️ Quedan {restantes} filas para mes {mes} en hoja {nombre_hoja}")
             
-            print(f"✓ {self.hojas[parametro]}: {valor} en fila {fila} (en memoria)")
+            print(f"✓ {nombre_hoja}: {valor} en fila {fila} (en memoria)")
             return True
             
         except KeyError as e:
@@ -117,30 +722,42 @@ class ExcelUnicoArchivo:
             return False
     
     def guardar_todos(self, datos):
-        """Guarda todos los parámetros y luego guarda el archivo"""
+        """Guarda todos los parámetros y luego guarda el archivo (síncrono; ver encolar_lecturas)"""
         print(f"\n💾 Escribiendo datos en memoria...")
         
-        # Escribir todos los datos en memoria
-        resultados = []
-        for parametro, valor in datos.items():
-            resultado = self.guardar_dato(parametro, valor)
-            resultados.append(resultado)
-        
         # Guardar el archivo UNA VEZ al final
-        try:
-            self.wb.save(self.archivo)
-            print(f"✅ Todos los datos guardados físicamente en {os.path.basename(self.archivo)}")
-        except Exception as e:
-            print(f"❌ Error al guardar el archivo: {e}")
+        if not self.esperar_libro():
+            print("❌ El libro no está cargado, no se guarda")
             return False
+        with self._lock_libro:
+            periodo = self._periodo(datetime.now())
+            if periodo != self.periodo and self._aplicadas:
+                print("❌ Hay lecturas del período anterior sin guardar, no se cambia de libro")
+                return False
+            if periodo != self.periodo and not self._abrir_periodo(periodo):
+                print(f"❌ No se pudo abrir el libro de {periodo}, no se guarda")
+                return False
+            # Escribir todos los datos en memoria
+            resultados = []
+            for parametro, valor in datos.items():
+                resultado = self.guardar_dato(parametro, valor)
+                resultados.append(resultado)
+            try:
+                self.wb.save(self.archivo)
+                print(f"✅ Todos los datos guardados físicamente en {os.path.basename(self.archivo)}")
+            except Exception as e:
+                print(f"❌ Error al guardar el archivo: {e}")
+                return False
         
         return all(resultados)
     
     def guardar_y_cerrar(self):
         """Guarda y cierra el libro explícitamente"""
-        if hasattr(self, 'wb'):
+        self.cerrar()
+        if self.esperar_libro():
             try:
-                self.wb.save(self.archivo)
+                with self._lock_libro:
+                    self.wb.save(self.archivo)
                 self.wb.close()
                 print(f"💾 Libro guardado y cerrado: {os.path.basename(self.archivo)}")
                 return True
@@ -151,7 +768,7 @@ class ExcelUnicoArchivo:
     
     def __del__(self):
         """Asegura que el libro se cierre si se destruye la instancia"""
-        if hasattr(self, 'wb'):
+        if getattr(self, 'wb', None) is not None:
             try:
                 self.wb.close()
             except:
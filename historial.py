@@ -0,0 +1,755 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import datetime
+import shutil
+
+CANALES = ("temperatura", "humedad", "presion1", "presion2", "presion3")
+
+# Versión del esquema de registros: v2 guarda el momento como "ts" (epoch en segundos)
+# en lugar de las cadenas "fecha" (dd/mm/yy) y "hora" (HH:MM) de v1
+ESQUEMA_REGISTRO = 2
+
+
+def nuevo_registro(datos, tipo, fuente, momento=None):
+    """Crea un registro de historial con el esquema actual"""
+    momento = momento or datetime.datetime.now()
+    return {
+        "v": ESQUEMA_REGISTRO,
+        "ts": int(momento.timestamp()),
+        "datos": datos,
+        "tipo": tipo,
+        "fuente": fuente
+    }
+
+
+def normalizar_registro(registro):
+    """Convierte un registro v1 (fecha/hora en texto) al esquema actual"""
+    if registro.get("v", 1) >= ESQUEMA_REGISTRO and "ts" in registro:
+        return registro
+    momento = datetime.datetime.strptime(
+        f"{registro['fecha']} {registro.get('hora', '00:00')}", "%d/%m/%y %H:%M"
+    )
+    registro.pop("fecha")
+    registro.pop("hora", None)
+    registro["ts"] = int(momento.timestamp())
+    registro["v"] = ESQUEMA_REGISTRO
+    return registro
+
+
+def formatear_ts(ts, formato="%d/%m/%y %H:%M"):
+    """Formatea un timestamp para mostrarlo (solo al renderizar)"""
+    return datetime.datetime.fromtimestamp(ts).strftime(formato)
+
+
+def resumen_vacio():
+    """Contadores de un mes: totales por tipo de registro y por fuente"""
+    return {"total": 0, "automaticos": 0, "manuales": 0, "por_tipo": {}, "por_fuente": {}}
+
+
+def sumar_al_resumen(conteos, registro, cantidad=1):
+    """Suma un registro (o un grupo de registros iguales) a los contadores de su mes"""
+    tipo = registro.get("tipo")
+    fuente = registro.get("fuente")
+    conteos["total"] += cantidad
+    if tipo == "registro_automatico":
+        conteos["automaticos"] += cantidad
+    elif tipo == "registro_manual":
+        conteos["manuales"] += cantidad
+    conteos["por_tipo"][tipo] = conteos["por_tipo"].get(tipo, 0) + cantidad
+    conteos["por_fuente"][fuente] = conteos["por_fuente"].get(fuente, 0) + cantidad
+    return conteos
+
+
+def rango_mes(mes_key):
+    """Devuelve (inicio, fin) del mes YYYY-MM como datetimes [inicio, fin)"""
+    anio, mes = (int(x) for x in mes_key.split("-"))
+    inicio = datetime.datetime(anio, mes, 1)
+    fin = datetime.datetime(anio + 1, 1, 1) if mes == 12 else datetime.datetime(anio, mes + 1, 1)
+    return inicio, fin
+
+
+class AlmacenHistorial:
+    """Historial de registros guardado como log de solo anexado.
+
+    Cada mes se escribe en su propio segmento ``historial_YYYY-MM.jsonl``
+    (un registro JSON por línea), así que agregar un registro cuesta lo
+    mismo sin importar el tamaño del historial y las exportaciones
+    mensuales solo leen el segmento que necesitan.
+    """
+
+    PREFIJO = "historial_"
+    EXTENSION = ".jsonl"
+
+    def __init__(self, carpeta="historial", archivo_legado="historial_registros.json", fsync=False):
+        self.carpeta = carpeta
+        self.archivo_legado = archivo_legado
+        self.fsync = fsync
+        self.proximo_id = 1
+        self._mes_actual = None
+        self._lock = threading.RLock()
+        # Conteo de líneas y resumen por segmento, válidos mientras no cambie su (mtime, tamaño)
+        self._conteos = {}
+        self._resumenes = {}
+
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._migrar_archivo_legado()
+        self._migrar_esquema()
+        self.recalcular_proximo_id()
+
+    # ---------- SEGMENTOS ----------
+
+    def _ruta_segmento(self, mes_key):
+        return os.path.join(self.carpeta, f"{self.PREFIJO}{mes_key}{self.EXTENSION}")
+
+    def meses(self):
+        """Devuelve las claves YYYY-MM que tienen segmento, en orden"""
+        meses = []
+        for nombre in os.listdir(self.carpeta):
+            if nombre.startswith(self.PREFIJO) and nombre.endswith(self.EXTENSION):
+                meses.append(nombre[len(self.PREFIJO):-len(self.EXTENSION)])
+        return sorted(meses)
+
+    def firma(self):
+        """Huella (nombre, mtime, tamaño) de los segmentos para detectar cambios externos"""
+        huella = []
+        for mes_key in self.meses():
+            try:
+                st = os.stat(self._ruta_segmento(mes_key))
+                huella.append((mes_key, st.st_mtime_ns, st.st_size))
+            except OSError:
+                continue
+        return tuple(huella)
+
+    def _firma_segmento(self, mes_key):
+        try:
+            st = os.stat(self._ruta_segmento(mes_key))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _leer_segmento(self, ruta):
+        """Lee un segmento ignorando líneas dañadas (p. ej. un corte a mitad de escritura)"""
+        registros = []
+        if not os.path.exists(ruta):
+            return registros
+        with open(ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    registros.append(normalizar_registro(json.loads(linea)))
+                except (ValueError, KeyError):
+                    print(f"AlmacenHistorial: Línea dañada ignorada en {os.path.basename(ruta)}")
+        return registros
+
+    def _leer_ultimas_lineas(self, ruta, n, bloque=8192):
+        """Lee hacia atrás desde el final del archivo hasta tener n líneas completas"""
+        with open(ruta, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            datos = b""
+            while pos > 0 and datos.count(b"\n") <= n:
+                leer = min(bloque, pos)
+                pos -= leer
+                f.seek(pos)
+                datos = f.read(leer) + datos
+
+        lineas = datos.split(b"\n")
+        if pos > 0:
+            # La primera línea quedó cortada por el bloque
+            lineas = lineas[1:]
+        lineas = [l for l in lineas if l.strip()]
+        return lineas[-n:] if n > 0 else []
+
+    # ---------- LECTURA ----------
+
+    def ultimos(self, n):
+        """Devuelve los n registros más recientes (orden cronológico) sin leer todo el historial"""
+        registros = []
+        with self._lock:
+            for mes_key in reversed(self.meses()):
+                faltan = n - len(registros)
+                if faltan <= 0:
+                    break
+                decodificados = []
+                for linea in self._leer_ultimas_lineas(self._ruta_segmento(mes_key), faltan):
+                    try:
+                        decodificados.append(normalizar_registro(json.loads(linea)))
+                    except (ValueError, KeyError):
+                        continue
+                registros = decodificados + registros
+        return registros
+
+    def contar(self):
+        """Cuenta los registros sin decodificarlos (solo recuenta segmentos modificados)"""
+        total = 0
+        with self._lock:
+            for mes_key in self.meses():
+                firma = self._firma_segmento(mes_key)
+                if firma is None:
+                    continue
+                conteo = self._conteos.get(mes_key)
+                if conteo is None or conteo[0] != firma:
+                    lineas = 0
+                    with open(self._ruta_segmento(mes_key), "rb") as f:
+                        for bloque in iter(lambda: f.read(1 << 16), b""):
+                            lineas += bloque.count(b"\n")
+                    conteo = (firma, lineas)
+                    self._conteos[mes_key] = conteo
+                total += conteo[1]
+        return total
+
+    def recalcular_proximo_id(self):
+        """Toma el próximo id del último registro guardado"""
+        ultimo = self.ultimos(1)
+        self.proximo_id = ultimo[0].get("id", 0) + 1 if ultimo else 1
+        return self.proximo_id
+
+    def cargar(self):
+        """Lee todos los segmentos y devuelve los registros en orden cronológico"""
+        with self._lock:
+            registros = []
+            for mes_key in self.meses():
+                registros.extend(self._leer_segmento(self._ruta_segmento(mes_key)))
+
+            max_id = max((r.get("id", 0) for r in registros), default=0)
+            self.proximo_id = max_id + 1
+            return registros
+
+    def leer_mes(self, mes_key):
+        """Devuelve solo los registros del mes YYYY-MM"""
+        with self._lock:
+            return self._leer_segmento(self._ruta_segmento(mes_key))
+
+    def leer_rango(self, desde, hasta):
+        """Devuelve los registros con momento en [desde, hasta)"""
+        ts_desde, ts_hasta = int(desde.timestamp()), int(hasta.timestamp())
+        registros = []
+        for mes_key in self.meses():
+            try:
+                inicio, fin = rango_mes(mes_key)
+            except ValueError:
+                continue
+            if fin <= desde or inicio >= hasta:
+                continue
+            registros.extend(r for r in self.leer_mes(mes_key) if ts_desde <= r["ts"] < ts_hasta)
+        return registros
+
+    def resumen_meses(self):
+        """Devuelve {YYYY-MM: contadores} (ver resumen_vacio); solo relee segmentos modificados"""
+        resumen = {}
+        with self._lock:
+            for mes_key in self.meses():
+                firma = self._firma_segmento(mes_key)
+                entrada = self._resumenes.get(mes_key)
+                if entrada is None or entrada[0] != firma:
+                    conteos = resumen_vacio()
+                    for registro in self.leer_mes(mes_key):
+                        sumar_al_resumen(conteos, registro)
+                    entrada = (firma, conteos)
+                    self._resumenes[mes_key] = entrada
+                if entrada[1]["total"]:
+                    resumen[mes_key] = entrada[1]
+        return resumen
+
+    # ---------- ESCRITURA ----------
+
+    def agregar(self, registro):
+        """Anexa un registro al segmento de su mes y le asigna un id"""
+        mes_key = formatear_ts(registro["ts"], "%Y-%m")
+
+        with self._lock:
+            if self._mes_actual is not None and mes_key != self._mes_actual:
+                # Rotación: el mes anterior queda cerrado y se compacta
+                self.compactar(self._mes_actual)
+            self._mes_actual = mes_key
+
+            registro["id"] = self.proximo_id
+            linea = json.dumps(registro, ensure_ascii=False) + "\n"
+            firma_previa = self._firma_segmento(mes_key)
+            with open(self._ruta_segmento(mes_key), "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.proximo_id += 1
+            self._actualizar_caches(mes_key, firma_previa, registro)
+        return registro
+
+    def _actualizar_caches(self, mes_key, firma_previa, registro):
+        """Suma el registro recién anexado a los contadores del segmento sin releerlo"""
+        firma = self._firma_segmento(mes_key)
+        if firma_previa is None:
+            # Segmento nuevo: los contadores empiezan en cero
+            self._conteos[mes_key] = (None, 0)
+            self._resumenes[mes_key] = (None, resumen_vacio())
+
+        conteo = self._conteos.get(mes_key)
+        if conteo is not None and conteo[0] == firma_previa:
+            self._conteos[mes_key] = (firma, conteo[1] + 1)
+        entrada = self._resumenes.get(mes_key)
+        if entrada is not None and entrada[0] == firma_previa:
+            self._resumenes[mes_key] = (firma, sumar_al_resumen(entrada[1], registro))
+
+    def compactar(self, mes_key=None):
+        """Reescribe segmentos eliminando líneas dañadas e ids duplicados"""
+        with self._lock:
+            for mes in ([mes_key] if mes_key else self.meses()):
+                ruta = self._ruta_segmento(mes)
+                if not os.path.exists(ruta):
+                    continue
+
+                vistos = set()
+                registros = []
+                for registro in self._leer_segmento(ruta):
+                    if registro.get("id") in vistos:
+                        continue
+                    vistos.add(registro.get("id"))
+                    registros.append(registro)
+
+                temporal = ruta + ".tmp"
+                with open(temporal, "w", encoding="utf-8") as f:
+                    for registro in registros:
+                        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporal, ruta)
+
+    def limpiar(self):
+        """Elimina todos los segmentos y reinicia los ids"""
+        with self._lock:
+            for mes_key in self.meses():
+                try:
+                    os.remove(self._ruta_segmento(mes_key))
+                except OSError as e:
+                    print(f"AlmacenHistorial: Error eliminando segmento {mes_key}: {e}")
+            self.proximo_id = 1
+            self._mes_actual = None
+            self._conteos.clear()
+            self._resumenes.clear()
+
+    # ---------- MIGRACIÓN ----------
+
+    def _migrar_archivo_legado(self):
+        """Importa el antiguo historial_registros.json a segmentos (una sola vez)"""
+        if not self.archivo_legado or not os.path.exists(self.archivo_legado) or self.meses():
+            return
+
+        try:
+            with open(self.archivo_legado, "r", encoding="utf-8") as f:
+                registros = json.load(f)
+        except Exception as e:
+            print(f"AlmacenHistorial: Error leyendo {self.archivo_legado}: {e}")
+            return
+
+        segmentos = {}
+        for i, registro in enumerate(registros):
+            registro.setdefault("id", i + 1)
+            try:
+                normalizar_registro(registro)
+            except (KeyError, ValueError) as e:
+                print(f"AlmacenHistorial: Registro #{registro['id']} sin fecha válida omitido: {e}")
+                continue
+            segmentos.setdefault(formatear_ts(registro["ts"], "%Y-%m"), []).append(registro)
+
+        for mes_key, regs in segmentos.items():
+            with open(self._ruta_segmento(mes_key), "w", encoding="utf-8") as f:
+                for registro in regs:
+                    f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+        os.replace(self.archivo_legado, self.archivo_legado + ".migrado")
+        print(f"AlmacenHistorial: {len(registros)} registros migrados desde {self.archivo_legado}")
+
+    def _migrar_esquema(self):
+        """Reescribe una sola vez los segmentos v1 con timestamps (deja respaldo .bak)"""
+        marca = os.path.join(self.carpeta, ".esquema")
+        try:
+            with open(marca, "r", encoding="utf-8") as f:
+                if int(f.read().strip() or 0) >= ESQUEMA_REGISTRO:
+                    return
+        except (OSError, ValueError):
+            pass
+
+        migrados = 0
+        for mes_key in self.meses():
+            ruta = self._ruta_segmento(mes_key)
+            if not self._tiene_registros_v1(ruta):
+                continue
+            shutil.copy2(ruta, ruta + ".bak")
+            self.compactar(mes_key)
+            migrados += 1
+
+        with open(marca, "w", encoding="utf-8") as f:
+            f.write(str(ESQUEMA_REGISTRO))
+        if migrados:
+            print(f"AlmacenHistorial: {migrados} segmentos migrados a esquema v{ESQUEMA_REGISTRO}")
+
+    def _tiene_registros_v1(self, ruta):
+        """Indica si el segmento conserva registros sin timestamp"""
+        with open(ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    if "ts" not in json.loads(linea):
+                        return True
+                except ValueError:
+                    continue
+        return False
+
+
+class AlmacenHistorialSQLite:
+    """Historial de registros en SQLite (modo WAL) con índice por timestamp.
+
+    Ofrece la misma interfaz que AlmacenHistorial; las consultas por mes y
+    por rango de tiempo usan el índice en lugar de recorrer todo el historial.
+    """
+
+    def __init__(self, archivo="historial.db", carpeta_segmentos="historial",
+                 archivo_legado="historial_registros.json"):
+        self.archivo = archivo
+        self.proximo_id = 1
+        self._lock = threading.RLock()
+
+        self.conexion = sqlite3.connect(archivo, check_same_thread=False)
+        self.conexion.row_factory = sqlite3.Row
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self._migrar_esquema()
+        self.conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS registros (
+                id INTEGER PRIMARY KEY,
+                ts INTEGER NOT NULL,
+                tipo TEXT,
+                fuente TEXT,
+                temperatura NUMERIC,
+                humedad NUMERIC,
+                presion1 NUMERIC,
+                presion2 NUMERIC,
+                presion3 NUMERIC,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_registros_ts_tipo ON registros (ts, tipo);
+        """)
+        self.conexion.commit()
+
+        self._importar_inicial(carpeta_segmentos, archivo_legado)
+        self.recalcular_proximo_id()
+
+    def firma(self):
+        """Huella (mtime, tamaño) de la base y su WAL para detectar cambios externos"""
+        huella = []
+        for ruta in (self.archivo, self.archivo + "-wal"):
+            try:
+                st = os.stat(ruta)
+                huella.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                huella.append(None)
+        return tuple(huella)
+
+    # ---------- CONVERSIÓN ----------
+
+    def _fila(self, registro):
+        datos = registro.get("datos", {}) or {}
+        extra = {k: v for k, v in datos.items() if k not in CANALES}
+        return (
+            registro.get("id"),
+            registro["ts"],
+            registro.get("tipo"),
+            registro.get("fuente"),
+            *(datos.get(canal) for canal in CANALES),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    def _registro(self, fila):
+        datos = {canal: fila[canal] for canal in CANALES if fila[canal] is not None}
+        if fila["extra"]:
+            datos.update(json.loads(fila["extra"]))
+        return {
+            "v": ESQUEMA_REGISTRO,
+            "id": fila["id"],
+            "ts": fila["ts"],
+            "datos": datos,
+            "tipo": fila["tipo"],
+            "fuente": fila["fuente"],
+        }
+
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return [self._registro(f) for f in self.conexion.execute(sql, parametros)]
+
+    # ---------- LECTURA ----------
+
+    def cargar(self):
+        """Devuelve todos los registros en orden cronológico"""
+        registros = self._consultar("SELECT * FROM registros ORDER BY ts, id")
+        self.recalcular_proximo_id()
+        return registros
+
+    def ultimos(self, n):
+        """Devuelve los n registros más recientes (orden cronológico)"""
+        registros = self._consultar("SELECT * FROM registros ORDER BY id DESC LIMIT ?", (n,))
+        registros.reverse()
+        return registros
+
+    def contar(self):
+        with self._lock:
+            return self.conexion.execute("SELECT COUNT(*) FROM registros").fetchone()[0]
+
+    def recalcular_proximo_id(self):
+        with self._lock:
+            max_id = self.conexion.execute("SELECT COALESCE(MAX(id), 0) FROM registros").fetchone()[0]
+            self.proximo_id = max_id + 1
+        return self.proximo_id
+
+    def leer_rango(self, desde, hasta):
+        """Devuelve los registros con momento en [desde, hasta)"""
+        return self._consultar(
+            "SELECT * FROM registros WHERE ts >= ? AND ts < ? ORDER BY ts, id",
+            (int(desde.timestamp()), int(hasta.timestamp()))
+        )
+
+    def leer_mes(self, mes_key):
+        """Devuelve los registros del mes YYYY-MM"""
+        return self.leer_rango(*rango_mes(mes_key))
+
+    def meses(self):
+        """Devuelve las claves YYYY-MM que tienen registros, en orden"""
+        return sorted(self.resumen_meses())
+
+    def resumen_meses(self):
+        """Devuelve {YYYY-MM: contadores} (ver resumen_vacio) agrupando en SQLite"""
+        with self._lock:
+            filas = self.conexion.execute("""
+                SELECT strftime('%Y-%m', ts, 'unixepoch', 'localtime') AS mes,
+                       tipo, fuente, COUNT(*) AS total
+                FROM registros
+                GROUP BY mes, tipo, fuente
+                ORDER BY mes
+            """).fetchall()
+        resumen = {}
+        for f in filas:
+            conteos = resumen.setdefault(f["mes"], resumen_vacio())
+            sumar_al_resumen(conteos, {"tipo": f["tipo"], "fuente": f["fuente"]}, f["total"])
+        return resumen
+
+    # ---------- ESCRITURA ----------
+
+    def agregar(self, registro):
+        """Inserta un registro y le asigna un id"""
+        with self._lock:
+            registro["id"] = self.proximo_id
+            self.conexion.execute(
+                "INSERT INTO registros VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._fila(registro)
+            )
+            self.conexion.commit()
+            self.proximo_id += 1
+        return registro
+
+    def compactar(self, mes_key=None):
+        """Hace checkpoint del WAL y optimiza la base de datos"""
+        with self._lock:
+            self.conexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conexion.execute("PRAGMA optimize")
+
+    def limpiar(self):
+        """Elimina todos los registros y reinicia los ids"""
+        with self._lock:
+            self.conexion.execute("DELETE FROM registros")
+            self.conexion.commit()
+            self.proximo_id = 1
+
+    def cerrar(self):
+        with self._lock:
+            self.conexion.close()
+
+    # ---------- MIGRACIÓN ----------
+
+    def _migrar_esquema(self):
+        """Pasa una tabla v1 (columnas fecha/hora) al esquema actual conservando ts"""
+        columnas = [c[1] for c in self.conexion.execute("PRAGMA table_info(registros)")]
+        if "fecha" not in columnas:
+            return
+        with self._lock:
+            self.conexion.executescript("""
+                BEGIN;
+                ALTER TABLE registros RENAME TO registros_v1;
+                DROP INDEX IF EXISTS idx_registros_ts_tipo;
+                CREATE TABLE registros (
+                    id INTEGER PRIMARY KEY,
+                    ts INTEGER NOT NULL,
+                    tipo TEXT,
+                    fuente TEXT,
+                    temperatura NUMERIC,
+                    humedad NUMERIC,
+                    presion1 NUMERIC,
+                    presion2 NUMERIC,
+                    presion3 NUMERIC,
+                    extra TEXT
+                );
+                INSERT INTO registros
+                    SELECT id, CAST(ts AS INTEGER), tipo, fuente, temperatura, humedad,
+                           presion1, presion2, presion3, extra
+                    FROM registros_v1;
+                DROP TABLE registros_v1;
+                COMMIT;
+            """)
+        print("AlmacenHistorialSQLite: Tabla migrada al esquema v2")
+
+    def _importar_inicial(self, carpeta_segmentos, archivo_legado):
+        """Si la base está vacía, importa el historial existente (segmentos o JSON antiguo)"""
+        with self._lock:
+            if self.conexion.execute("SELECT 1 FROM registros LIMIT 1").fetchone():
+                return
+
+        if not os.path.isdir(carpeta_segmentos) and not (archivo_legado and os.path.exists(archivo_legado)):
+            return
+
+        registros = AlmacenHistorial(carpeta_segmentos, archivo_legado).cargar()
+        filas = []
+        for registro in registros:
+            try:
+                filas.append(self._fila(normalizar_registro(registro)))
+            except (KeyError, ValueError) as e:
+                print(f"AlmacenHistorialSQLite: Registro omitido en la importación: {e}")
+
+        with self._lock:
+            self.conexion.executemany(
+                "INSERT OR IGNORE INTO registros VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", filas
+            )
+            self.conexion.commit()
+        if filas:
+            print(f"AlmacenHistorialSQLite: {len(filas)} registros importados")
+
+
+def crear_almacen_historial(backend="segmentos", **opciones):
+    """Crea el almacén de historial indicado ("segmentos" o "sqlite")"""
+    if backend == "sqlite":
+        return AlmacenHistorialSQLite(**opciones)
+    return AlmacenHistorial(**opciones)
+
+
+class SistemaHistorial:
+    """Historial de registros compartido por RelojGlobal, UMA y ConfiguracionContainer.
+
+    La lista completa solo se lee del almacén cuando alguien la pide; la
+    pantalla de inicio usa ultimos(n) y contar_registros(), que no dependen
+    del tamaño del historial. Si otro proceso modifica el almacén (cambia
+    su mtime/tamaño) lo que hay en memoria se invalida.
+    """
+
+    def __init__(self, almacen=None):
+        self.almacen = almacen or crear_almacen_historial()
+        self.registros = None  # Se cargan bajo demanda
+        self.proximo_id = self.almacen.proximo_id
+        self._conteo = None
+        self._indice_meses = None  # {YYYY-MM: contadores}, se mantiene en cada agregar
+        self._firma = self.almacen.firma()
+        self._lock = threading.RLock()
+
+    def cargar_registros(self):
+        """Carga todos los registros desde el almacén"""
+        with self._lock:
+            try:
+                self.registros = self.almacen.cargar()
+                self._conteo = len(self.registros)
+            except Exception as e:
+                print(f"SistemaHistorial: Error cargando registros: {e}")
+                self.registros = []
+            self.proximo_id = self.almacen.proximo_id
+            self._firma = self.almacen.firma()
+            return self.registros
+
+    def refrescar_si_cambio(self):
+        """Invalida la memoria solo si el almacén fue modificado fuera de este proceso"""
+        with self._lock:
+            if self.almacen.firma() != self._firma:
+                print("SistemaHistorial: Cambio externo detectado")
+                self.registros = None
+                self._conteo = None
+                self._indice_meses = None
+                self.proximo_id = self.almacen.recalcular_proximo_id()
+                self._firma = self.almacen.firma()
+
+    def agregar(self, registro):
+        """Guarda un registro en el almacén y en memoria"""
+        with self._lock:
+            # Si otro proceso escribió, refrescar antes para no repetir ids
+            self.refrescar_si_cambio()
+            try:
+                self.almacen.agregar(registro)
+                if self.registros is not None:
+                    self.registros.append(registro)
+                if self._conteo is not None:
+                    self._conteo += 1
+                if self._indice_meses is not None:
+                    mes_key = formatear_ts(registro["ts"], "%Y-%m")
+                    sumar_al_resumen(self._indice_meses.setdefault(mes_key, resumen_vacio()), registro)
+            except Exception as e:
+                print(f"SistemaHistorial: Error guardando registro: {e}")
+            self._firma = self.almacen.firma()
+            self.proximo_id = self.almacen.proximo_id
+        return registro
+
+    def agregar_registro(self, temperatura, humedad, presion, tipo="manual", fuente="UMA"):
+        """Agrega un registro con el mismo formato que RelojGlobal"""
+        datos = {
+            "temperatura": temperatura,
+            "humedad": humedad,
+            "presion1": presion
+        }
+        return self.agregar(nuevo_registro(datos, tipo, fuente))
+
+    def eliminar_todos_registros(self):
+        """Elimina todos los registros"""
+        with self._lock:
+            self.almacen.limpiar()
+            self.registros = []
+            self._conteo = 0
+            self._indice_meses = {}
+            self.proximo_id = 1
+            self._firma = self.almacen.firma()
+
+    def obtener_registros(self):
+        """Devuelve todos los registros (los carga la primera vez)"""
+        with self._lock:
+            self.refrescar_si_cambio()
+            if self.registros is None:
+                self.cargar_registros()
+            return self.registros.copy()
+
+    def ultimos(self, n):
+        """Devuelve los n registros más recientes en orden cronológico"""
+        with self._lock:
+            self.refrescar_si_cambio()
+            if self.registros is not None:
+                return self.registros[-n:] if n > 0 else []
+            return self.almacen.ultimos(n)
+
+    def contar_registros(self):
+        """Cuenta el número de registros"""
+        with self._lock:
+            self.refrescar_si_cambio()
+            if self._conteo is None:
+                self._conteo = self.almacen.contar()
+            return self._conteo
+
+    def obtener_registros_mes(self, mes_key):
+        return self.almacen.leer_mes(mes_key)
+
+    def obtener_registros_rango(self, desde, hasta):
+        return self.almacen.leer_rango(desde, hasta)
+
+    def resumen_por_mes(self):
+        """Contadores por mes en orden cronológico, sin recorrer los registros"""
+        with self._lock:
+            self.refrescar_si_cambio()
+            if self._indice_meses is None:
+                self._indice_meses = {
+                    mes_key: copy.deepcopy(conteos)
+                    for mes_key, conteos in self.almacen.resumen_meses().items()
+                }
+            return {mes_key: copy.deepcopy(self._indice_meses[mes_key]) for mes_key in sorted(self._indice_meses)}
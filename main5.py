@@ -1,36 +1,96 @@
+import time
+_INICIO_PROCESO = time.perf_counter()
 import flet as ft
 import threading
-import time
 import datetime
 import json
 import os
 import random
+import heapq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from cajaAzul import BlueBox
 from configuracion import ConfiguracionContainer
 from excel5 import ExcelUnicoArchivo
-from alertas import SistemaAlertas, AlertasView
+from alertas import SistemaAlertas, AlertasView, DetectorEpisodios
 from paguina1 import UMA
+from historial import crear_almacen_historial, nuevo_registro, formatear_ts, SistemaHistorial
+from actualizaciones import programar_actualizacion
+
+# Tiempos del arranque en ms (se informan al mostrar la aplicación)
+TIEMPOS_ARRANQUE = {"importaciones": (time.perf_counter() - _INICIO_PROCESO) * 1000}
 
 
 class RelojGlobal:
-    def __init__(self):
+    # Tiempo máximo que duerme el hilo del reloj antes de revisar la agenda
+    # (cubre cambios en el reloj del sistema)
+    ESPERA_MAXIMA = 60
+    # Retraso (segundos) a partir del cual una alarma se registra como tardía
+    TOLERANCIA_RETRASO = 1.0
+    # Hilos disponibles para ejecutar los callbacks de alarma
+    MAX_TRABAJADORES_CALLBACK = 4
+    # Segundos tras los cuales un callback de alarma se considera vencido
+    TIMEOUT_CALLBACK = 30
+    # Backend del historial: "segmentos" (JSONL por mes) o "sqlite"
+    BACKEND_HISTORIAL = "segmentos"
+    # Archivo JSON del formato anterior del historial (se migra al abrir)
+    ARCHIVO_HISTORIAL_LEGADO = "historial_registros.json"
+
+    def __init__(self, backend_historial=None, historial=None):
         self.horas_registradas = []
         self.archivo_horas = "horas.json"
-        self.historial_registros = []
-        self.archivo_historial = "historial_registros.json"
+        self.archivo_historial = self.ARCHIVO_HISTORIAL_LEGADO
+        # Historial único en memoria, compartido con UMA y ConfiguracionContainer
+        # (puede llegar ya cargado desde la precarga del arranque)
+        self.historial = historial or self.crear_historial(backend_historial)
         self.reloj_activo = True
         self.ultima_ejecucion = {}
         self.callbacks = []
         self.historial_callbacks = []
         
+        # Despacho de callbacks: cada suscriptor tiene su cola y usa como mucho un hilo
+        self._ejecutor = ThreadPoolExecutor(
+            max_workers=self.MAX_TRABAJADORES_CALLBACK,
+            thread_name_prefix="RelojGlobal-callback"
+        )
+        self._lock_callbacks = threading.Lock()
+        self._estado_callbacks = {}
+        
+        # Agenda de próximos disparos: heap de (datetime, hora) y la entrada vigente por hora
+        self._condicion = threading.Condition()
+        self._agenda = []
+        self._agendadas = {}
+        self._dia_actual = None
+        
         # Cargar horas guardadas
         self.cargar_horas()
-        self.cargar_historial()
+        print(f"RelojGlobal: Historial cargado ({self.historial.contar_registros()} registros)")
         self.iniciar()
 
+    @classmethod
+    def crear_historial(cls, backend_historial=None):
+        """Abre el almacén del historial y carga su índice en memoria"""
+        return SistemaHistorial(crear_almacen_historial(
+            backend_historial or cls.BACKEND_HISTORIAL,
+            archivo_legado=cls.ARCHIVO_HISTORIAL_LEGADO
+        ))
+
     def agregar_callback(self, callback):
         """Agrega una función que se ejecutará cuando suene una alarma"""
-        self.callbacks.append(callback)
+        with self._lock_callbacks:
+            self.callbacks.append(callback)
+            self._estado_callbacks[callback] = {
+                "nombre": getattr(callback, "__qualname__", repr(callback)),
+                "pendientes": deque(),
+                "en_curso_desde": None,
+                "ejecuciones": 0,
+                "fallos": 0,
+                "timeouts": 0,
+                "latencia_total": 0.0,
+                "latencia_max": 0.0,
+                "ultima_latencia": None,
+                "ultimo_error": None,
+            }
     
     def agregar_callback_historial(self, callback):
         """Agrega una función que se ejecutará cuando se agregue un nuevo registro al historial"""
@@ -51,18 +111,10 @@ class RelojGlobal:
                 print(f"RelojGlobal: Error cargando horas: {e}")
                 self.horas_registradas = []
     
-    def cargar_historial(self):
-        """Carga el historial desde archivo JSON"""
-        if os.path.exists(self.archivo_historial):
-            try:
-                with open(self.archivo_historial, "r") as file:
-                    self.historial_registros = json.load(file)
-                print(f"RelojGlobal: Historial cargado ({len(self.historial_registros)} registros)")
-            except Exception as e:
-                print(f"RelojGlobal: Error cargando historial: {e}")
-                self.historial_registros = []
-        else:
-            self.guardar_historial()
+    @property
+    def historial_registros(self):
+        """Registros del historial compartido (lectura desde memoria)"""
+        return self.historial.obtener_registros()
 
     def guardar_horas(self):
         """Guarda las horas en archivo JSON"""
@@ -73,46 +125,35 @@ class RelojGlobal:
         except Exception as e:
             print(f"RelojGlobal: Error guardando horas: {e}")
     
-    def guardar_historial(self):
-        """Guarda el historial en archivo JSON"""
-        try:
-            if len(self.historial_registros) > 100:  # Aumentado a 100 registros
-                self.historial_registros = self.historial_registros[-100:]
-            
-            with open(self.archivo_historial, "w") as file:
-                json.dump(self.historial_registros, file, indent=2)
-        except Exception as e:
-            print(f"RelojGlobal: Error guardando historial: {e}")
-
     def agregar_hora(self, hora_time):
         """Agrega una hora a la lista global"""
-        if hora_time not in self.horas_registradas:
+        with self._condicion:
+            if hora_time in self.horas_registradas:
+                return False
             self.horas_registradas.append(hora_time)
-            self.guardar_horas()
-            print(f"RelojGlobal: Hora agregada: {hora_time.strftime('%I:%M %p')}")
-            return True
-        return False
+            self._programar(hora_time, datetime.datetime.now())
+            self._condicion.notify()
+        self.guardar_horas()
+        print(f"RelojGlobal: Hora agregada: {hora_time.strftime('%I:%M %p')}")
+        return True
 
     def eliminar_hora(self, hora_time):
         """Elimina una hora de la lista global"""
-        if hora_time in self.horas_registradas:
+        with self._condicion:
+            if hora_time not in self.horas_registradas:
+                return False
             self.horas_registradas.remove(hora_time)
-            self.guardar_horas()
-            print(f"RelojGlobal: Hora eliminada: {hora_time.strftime('%I:%M %p')}")
-            return True
-        return False
+            # La entrada del heap queda huérfana y se descarta al llegar a la cima
+            self._agendadas.pop(hora_time, None)
+            self._condicion.notify()
+        self.guardar_horas()
+        print(f"RelojGlobal: Hora eliminada: {hora_time.strftime('%I:%M %p')}")
+        return True
     
     def agregar_al_historial(self, datos, tipo="registro_automatico", fuente="Reloj Global"):
         """Agrega un registro al historial"""
-        registro = {
-            "fecha": datetime.datetime.now().strftime("%d/%m/%y"),
-            "hora": datetime.datetime.now().strftime("%H:%M"),
-            "datos": datos,
-            "tipo": tipo,
-            "fuente": fuente
-        }
-        self.historial_registros.append(registro)
-        self.guardar_historial()
+        registro = nuevo_registro(datos, tipo, fuente)
+        self.historial.agregar(registro)
         
         # Notificar a todos los callbacks
         for callback in self.historial_callbacks:
@@ -123,10 +164,21 @@ class RelojGlobal:
         
         return registro
     
+    def obtener_registros_mes(self, mes_key):
+        """Devuelve los registros del mes YYYY-MM (consulta indexada en el almacén)"""
+        return self.historial.obtener_registros_mes(mes_key)
+
+    def obtener_registros_rango(self, desde, hasta):
+        """Devuelve los registros entre dos datetimes [desde, hasta)"""
+        return self.historial.obtener_registros_rango(desde, hasta)
+
+    def resumen_historial_por_mes(self):
+        """Devuelve {YYYY-MM: {"total", "automaticos", "manuales"}}"""
+        return self.historial.resumen_por_mes()
+
     def limpiar_historial(self):
         """Limpia todo el historial"""
-        self.historial_registros = []
-        self.guardar_historial()
+        self.historial.eliminar_todos_registros()
         print("RelojGlobal: Historial limpiado")
         
         # Notificar a los callbacks
@@ -139,53 +191,171 @@ class RelojGlobal:
     def iniciar(self):
         """Inicia el reloj global en un hilo separado"""
         if not hasattr(self, 'thread') or not self.thread.is_alive():
+            self.reloj_activo = True
+            with self._condicion:
+                ahora = datetime.datetime.now()
+                self._agenda = []
+                self._agendadas = {}
+                for hora_obj in self.horas_registradas:
+                    self._programar(hora_obj, ahora)
             self.thread = threading.Thread(target=self._loop, daemon=True)
             self.thread.start()
             print("RelojGlobal: Iniciado")
 
+    def _proximo_disparo(self, hora_obj, desde):
+        """Devuelve el primer datetime posterior a 'desde' en que toca la hora indicada"""
+        disparo = datetime.datetime.combine(desde.date(), hora_obj)
+        if disparo <= desde:
+            disparo += datetime.timedelta(days=1)
+        return disparo
+
+    def _programar(self, hora_obj, desde):
+        """Agenda el próximo disparo de una hora (requiere tener self._condicion)"""
+        disparo = self._proximo_disparo(hora_obj, desde)
+        self._agendadas[hora_obj] = disparo
+        heapq.heappush(self._agenda, (disparo, hora_obj))
+
+    def _esperar_alarma(self):
+        """Duerme hasta el próximo disparo o hasta que cambie la agenda.
+
+        Devuelve (hora_str, retraso) si hay una alarma que ejecutar, o None
+        si el hilo despertó sin nada pendiente.
+        """
+        with self._condicion:
+            ahora = datetime.datetime.now()
+            self._limpiar_ejecuciones(ahora.date())
+
+            # Descartar entradas de horas eliminadas o reprogramadas
+            while self._agenda and self._agendadas.get(self._agenda[0][1]) != self._agenda[0][0]:
+                heapq.heappop(self._agenda)
+
+            if not self._agenda:
+                self._condicion.wait(self.ESPERA_MAXIMA)
+                return None
+
+            disparo, hora_obj = self._agenda[0]
+            espera = (disparo - ahora).total_seconds()
+            if espera > 0:
+                self._condicion.wait(min(espera, self.ESPERA_MAXIMA))
+                return None
+
+            # Vencida: reprogramar una sola vez, aunque se hayan perdido varios días
+            heapq.heappop(self._agenda)
+            self._programar(hora_obj, max(ahora, disparo))
+
+            clave = disparo.strftime("%Y-%m-%d %H:%M")
+            if clave in self.ultima_ejecucion:
+                return None
+
+            retraso = -espera
+            tardia = retraso >= self.TOLERANCIA_RETRASO
+            self.ultima_ejecucion[clave] = {"retraso": round(retraso, 3), "tardia": tardia}
+            return hora_obj.strftime("%I:%M %p"), retraso
+
+    def _limpiar_ejecuciones(self, hoy):
+        """Olvida las ejecuciones de días anteriores (solo al cambiar de día)"""
+        if self._dia_actual == hoy:
+            return
+        self._dia_actual = hoy
+        hoy_str = hoy.strftime("%Y-%m-%d")
+        for clave in [k for k in self.ultima_ejecucion if k[:10] < hoy_str]:
+            del self.ultima_ejecucion[clave]
+
     def _loop(self):
         """Loop principal del reloj"""
         while self.reloj_activo:
             try:
-                ahora = datetime.datetime.now()
-                
-                for hora_obj in self.horas_registradas:
-                    hora_actual_minuto = ahora.strftime("%I:%M %p")
-                    segundos = ahora.strftime("%S")
-                    hora_objetivo_str = hora_obj.strftime("%I:%M %p")
-
-                    if hora_actual_minuto == hora_objetivo_str and segundos == "00":
-                        h_obj = datetime.datetime.combine(ahora.date(), hora_obj)
-                        clave = h_obj.strftime("%Y-%m-%d %H:%M")
-
-                        if clave not in self.ultima_ejecucion:
-                            self.ultima_ejecucion[clave] = True
-                            self._ejecutar_alarma(hora_objetivo_str)
-                            print(f"RelojGlobal: ✓ Alarma: {hora_objetivo_str}")
-                
-                hoy = datetime.datetime.now().date()
-                claves_a_eliminar = [k for k in self.ultima_ejecucion 
-                                    if datetime.datetime.strptime(k.split(" ")[0], "%Y-%m-%d").date() < hoy]
-                for k in claves_a_eliminar:
-                    del self.ultima_ejecucion[k]
+                pendiente = self._esperar_alarma()
+                if pendiente is None:
+                    continue
+
+                hora_objetivo_str, retraso = pendiente
+                self._ejecutar_alarma(hora_objetivo_str)
+                if retraso >= self.TOLERANCIA_RETRASO:
+                    print(f"RelojGlobal: ⚠ Alarma tardía: {hora_objetivo_str} (+{retraso:.1f} s)")
+                else:
+                    print(f"RelojGlobal: ✓ Alarma: {hora_objetivo_str}")
 
-                time.sleep(1)
-                
             except Exception as e:
                 print(f"RelojGlobal: Error en loop: {e}")
                 time.sleep(1)
 
     def _ejecutar_alarma(self, hora):
-        """Ejecuta todos los callbacks registrados"""
-        for callback in self.callbacks:
+        """Encola la alarma para cada callback sin bloquear el hilo del reloj"""
+        with self._lock_callbacks:
+            for callback in self.callbacks:
+                estado = self._estado_callbacks[callback]
+                estado["pendientes"].append(hora)
+
+                if estado["en_curso_desde"] is None:
+                    estado["en_curso_desde"] = time.monotonic()
+                    self._ejecutor.submit(self._atender_callback, callback, estado)
+                else:
+                    # Sigue ocupado con una alarma anterior: esta queda en su cola
+                    ocupado = time.monotonic() - estado["en_curso_desde"]
+                    if ocupado > self.TIMEOUT_CALLBACK:
+                        print(f"RelojGlobal: ⚠ Callback {estado['nombre']} lleva {ocupado:.0f} s ocupado")
+
+    def _atender_callback(self, callback, estado):
+        """Ejecuta en un hilo del pool las alarmas pendientes de un callback"""
+        while True:
+            with self._lock_callbacks:
+                if not estado["pendientes"]:
+                    estado["en_curso_desde"] = None
+                    return
+                hora = estado["pendientes"].popleft()
+                estado["en_curso_desde"] = time.monotonic()
+
+            inicio = time.perf_counter()
+            error = None
             try:
                 callback(hora)
             except Exception as e:
-                print(f"RelojGlobal: Error en callback: {e}")
+                error = e
+                print(f"RelojGlobal: Error en callback {estado['nombre']}: {e}")
+            latencia = time.perf_counter() - inicio
+
+            with self._lock_callbacks:
+                estado["ejecuciones"] += 1
+                estado["latencia_total"] += latencia
+                estado["latencia_max"] = max(estado["latencia_max"], latencia)
+                estado["ultima_latencia"] = latencia
+                if error is not None:
+                    estado["fallos"] += 1
+                    estado["ultimo_error"] = str(error)
+                if latencia > self.TIMEOUT_CALLBACK:
+                    estado["timeouts"] += 1
+                    print(f"RelojGlobal: ⚠ Callback {estado['nombre']} excedió {self.TIMEOUT_CALLBACK} s ({latencia:.1f} s)")
+
+    def obtener_estadisticas_callbacks(self):
+        """Devuelve latencias y fallos acumulados por cada callback de alarma"""
+        ahora = time.monotonic()
+        estadisticas = []
+        with self._lock_callbacks:
+            for callback in self.callbacks:
+                estado = self._estado_callbacks[callback]
+                ejecuciones = estado["ejecuciones"]
+                en_curso = estado["en_curso_desde"]
+                estadisticas.append({
+                    "nombre": estado["nombre"],
+                    "ejecuciones": ejecuciones,
+                    "fallos": estado["fallos"],
+                    "timeouts": estado["timeouts"],
+                    "pendientes": len(estado["pendientes"]),
+                    "en_curso_s": round(ahora - en_curso, 3) if en_curso is not None else None,
+                    "latencia_media_s": round(estado["latencia_total"] / ejecuciones, 3) if ejecuciones else None,
+                    "latencia_max_s": round(estado["latencia_max"], 3),
+                    "ultima_latencia_s": round(estado["ultima_latencia"], 3) if estado["ultima_latencia"] is not None else None,
+                    "ultimo_error": estado["ultimo_error"],
+                })
+        return estadisticas
 
     def detener(self):
         """Detiene el reloj global"""
-        self.reloj_activo = False
+        with self._condicion:
+            self.reloj_activo = False
+            self._condicion.notify_all()
+        self._ejecutor.shutdown(wait=False)
 
 
 class LoginScreen:
@@ -336,10 +506,6 @@ class LoginScreen:
             self.rol_actual = self.usuarios[username]["rol"]
             self.mostrar_notificacion("✓ Inicio de sesión exitoso", ft.Colors.GREEN)
             
-            # Esperar un momento antes de redirigir
-            import time
-            time.sleep(0.5)
-            
             # Llamar al callback de éxito con usuario y rol
             self.on_login_success(username, self.rol_actual)
         else:
@@ -473,7 +639,54 @@ class LoginScreen:
         self.page.update()
 
 
+class VistaLecturas:
+    """Controles que muestran lecturas en vivo dentro de una página.
+
+    Guarda siempre la última lectura, pero solo la envía a la UI mientras
+    la página está activa; al activarse muestra la última lectura guardada.
+    """
+
+    def __init__(self, page, controles, activa=False):
+        self.page = page
+        self.controles = controles  # {canal: [(control, formato)]}
+        self.activa = activa
+        self.ultimas = None
+
+    def activar(self):
+        self.activa = True
+        if self.ultimas is not None:
+            self.mostrar(self.ultimas)
+
+    def desactivar(self):
+        self.activa = False
+
+    def mostrar(self, datos):
+        self.ultimas = datos
+        if not self.activa:
+            return
+        cambiados = []
+        for canal, salidas in self.controles.items():
+            if canal not in datos:
+                continue
+            for control, formato in salidas:
+                control.value = formato.format(datos[canal])
+                cambiados.append(control)
+        programar_actualizacion(self.page, *cambiados)
+
+
 class UI(ft.Container):
+    # Umbrales de alerta por canal: se activa al superar "activar" durante
+    # "permanencia" segundos y se libera al bajar de "liberar" el mismo tiempo
+    UMBRALES_ALERTA = {
+        "temperatura": {"activar": 30, "liberar": 28, "permanencia": 4, "causa": "Temperatura CRÍTICA", "unidad": "°C", "elemento": "Termómetro"},
+        "humedad": {"activar": 85, "liberar": 80, "permanencia": 4, "causa": "Humedad ALTA", "unidad": "%", "elemento": "Hidrómetro"},
+        "presion1": {"activar": 108, "liberar": 105, "permanencia": 4, "causa": "Presión ALTA", "unidad": " Pa", "elemento": "Manómetro 1"},
+        "presion2": {"activar": 108, "liberar": 105, "permanencia": 4, "causa": "Presión ALTA", "unidad": " Pa", "elemento": "Manómetro 2"},
+        "presion3": {"activar": 108, "liberar": 105, "permanencia": 4, "causa": "Presión ALTA", "unidad": " Pa", "elemento": "Manómetro 3"},
+    }
+    # Repeticiones de la misma alerta dentro de esta ventana se acumulan en una sola
+    VENTANA_DEDUPLICACION_ALERTAS = 600
+
     def __init__(self, page):
         super().__init__(expand=True)
         self.page = page
@@ -483,8 +696,44 @@ class UI(ft.Container):
         # Guardar referencia en la página para que otros componentes puedan acceder
         self.page.ui_instance = self
         
+        # Cargar Excel y archivos JSON mientras el usuario inicia sesión
+        self.excel_manager = None
+        self.sistema_alertas = None
+        self.alertas_view = None
+        self._precarga = {}
+        self._iniciar_precarga()
+        
         # Primero mostrar pantalla de login
+        inicio = time.perf_counter()
         self.mostrar_login()
+        TIEMPOS_ARRANQUE["login_visible"] = (time.perf_counter() - inicio) * 1000
+    
+    def _iniciar_precarga(self):
+        """Lanza en segundo plano la carga del libro de Excel, el historial y las alertas"""
+        ejecutor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="Precarga")
+        self._precarga = {
+            "excel": ejecutor.submit(ExcelUnicoArchivo),
+            "historial": ejecutor.submit(RelojGlobal.crear_historial),
+            "alertas": ejecutor.submit(SistemaAlertas, ventana_deduplicacion=self.VENTANA_DEDUPLICACION_ALERTAS),
+        }
+        ejecutor.shutdown(wait=False)
+    
+    def _tomar_precarga(self, nombre, fabrica):
+        """Devuelve lo precargado (una sola vez); si no hay o falló, lo crea ahora"""
+        futuro = self._precarga.pop(nombre, None)
+        if futuro is not None:
+            try:
+                return futuro.result()
+            except Exception as e:
+                print(f"UI: Error en la precarga de {nombre}, se carga de nuevo: {e}")
+        return fabrica()
+    
+    def _reportar_arranque(self):
+        """Imprime los tiempos del arranque"""
+        tiempos = " | ".join(f"{etapa} {ms:.0f} ms" for etapa, ms in TIEMPOS_ARRANQUE.items())
+        carga_libro = getattr(self.excel_manager, "tiempo_carga", None)
+        libro = f"{carga_libro * 1000:.0f} ms" if carga_libro is not None else "en curso"
+        print(f"UI: Arranque: {tiempos} | libro Excel {libro}")
     
     def mostrar_login(self):
         """Muestra la pantalla de inicio de sesión"""
@@ -524,6 +773,7 @@ class UI(ft.Container):
     
     def inicializar_aplicacion(self):
         """Inicializa la aplicación principal después del login"""
+        inicio = time.perf_counter()
         # Limpiar la página
         self.page.clean()
         
@@ -536,10 +786,22 @@ class UI(ft.Container):
             'presion3': 0,
         }
 
-        self.excel_manager = ExcelUnicoArchivo()
+        # Lo precargado en el login se usa una vez; en sesiones siguientes se carga aquí
+        # El libro, las alertas y sus colas de escritura se conservan entre sesiones:
+        # otra instancia leería el archivo antes del guardado pendiente y lo pisaría
+        if self.excel_manager is None:
+            self.excel_manager = self._tomar_precarga("excel", ExcelUnicoArchivo)
+        historial = self._tomar_precarga("historial", RelojGlobal.crear_historial)
+        if self.sistema_alertas is None:
+            self.sistema_alertas = self._tomar_precarga(
+                "alertas", lambda: SistemaAlertas(ventana_deduplicacion=self.VENTANA_DEDUPLICACION_ALERTAS)
+            )
+        TIEMPOS_ARRANQUE["espera_precarga"] = (time.perf_counter() - inicio) * 1000
         
-        self.reloj_global = RelojGlobal()
-        self.sistema_alertas = SistemaAlertas()
+        self.reloj_global = RelojGlobal(historial=historial)
+        # El libro reserva una fila por alarma programada y día
+        self.excel_manager.configurar_lecturas_por_dia(len(self.reloj_global.horas_registradas))
+        self.detector_alertas = DetectorEpisodios(self.sistema_alertas, "UMA", self.UMBRALES_ALERTA)
         self.alertas_view = None
 
         self.reloj_global.agregar_callback(self._on_alarma)
@@ -568,11 +830,12 @@ class UI(ft.Container):
         self.content = layout_principal
         
         self.configurar_banner()
-        self.inicializar_alertas_view()
         
         # Agregar a la página
         self.page.add(self)
         self.page.update()
+        TIEMPOS_ARRANQUE["primer_pintado"] = (time.perf_counter() - inicio) * 1000
+        self._reportar_arranque()
     
     def crear_barra_usuario(self):
         """Crea la barra superior con información del usuario"""
@@ -632,6 +895,10 @@ class UI(ft.Container):
     
     def cerrar_sesion(self, e):
         """Cierra la sesión actual y vuelve al login"""
+        # La vista de alertas de esta sesión deja de recibir cambios
+        if self.alertas_view is not None:
+            self.sistema_alertas.desuscribir(self.alertas_view._on_cambio_alertas)
+            self.alertas_view = None
         self.mostrar_login()
     
     def inicializar_alertas_view(self):
@@ -711,10 +978,7 @@ class UI(ft.Container):
         self.sistema_alertas.agregar_alerta(
             causa="Registro manual ejecutado desde Home",
             pagina="UMA",
-            datos_adicionales={
-                "fecha": registro["fecha"],
-                "hora": registro["hora"]
-            }
+            valor=formatear_ts(registro["ts"])
         )
         
         self.mostrar_notificacion("✓ Registro manual agregado", ft.Colors.GREEN)
@@ -764,7 +1028,7 @@ class UI(ft.Container):
         )
         self.page.snack_bar = snackbar
         snackbar.open = True
-        self.page.update()
+        programar_actualizacion(self.page)
 
     def configurar_banner(self):
         self.banner = ft.Banner(
@@ -795,8 +1059,10 @@ class UI(ft.Container):
         
         datos_actuales = self.obtener_datos_actuales_redondeados()
         
-        if hasattr(self, 'excel_manager'):
-            self.excel_manager.guardar_todos(datos_actuales)
+        if self.excel_manager is not None:
+            # Se escribe en segundo plano; la lectura queda en cola hasta guardarse
+            self.excel_manager.configurar_lecturas_por_dia(len(self.reloj_global.horas_registradas))
+            self.excel_manager.encolar_lecturas(datos_actuales)
             
         registro = self.reloj_global.agregar_al_historial(
             datos_actuales, 
@@ -804,10 +1070,6 @@ class UI(ft.Container):
             fuente=f"Alarma {hora}"
         )
         
-        # FORZAR ACTUALIZACIÓN DE UMA INMEDIATAMENTE
-        if hasattr(self, 'uma_instance'):
-            self.page.run_thread(lambda: self.uma_instance.actualizar_lista())
-        
         self.sistema_alertas.agregar_alerta(
             causa=f"Registro automático ejecutado a las {hora}",
             pagina="Reloj Global",
@@ -841,53 +1103,17 @@ class UI(ft.Container):
             reloj_global=self.reloj_global
         )
 
-        self.blue_box_presion1 = BlueBox(texto_titulo="MANOMETRO 1",texto=f"{self.datos_tiempo_real['presion1']} Pa", mostrar_boton=False)
-        self.blue_box_presion2 = BlueBox(texto_titulo="MANOMETRO 2",texto=f"{self.datos_tiempo_real['presion2']} Pa", mostrar_boton=False)
-        self.blue_box_presion3 = BlueBox(texto_titulo="MANOMETRO 3",texto=f"{self.datos_tiempo_real['presion3']} Pa", mostrar_boton=False)
-        
-        self.blue_boxes = {
-            'presion1': self.blue_box_presion1,
-            'presion2': self.blue_box_presion2,
-            'presion3': self.blue_box_presion3,
-        }
+        # Lecturas en vivo de cada página (solo se envían con la página visible)
+        self.vista_lecturas_home = VistaLecturas(self.page, {
+            'temperatura': [(self.txt_temp_home, "{} °C")],
+            'humedad': [(self.txt_hum_home, "{} %")],
+            'presion1': [(self.txt_pres_home, "{} Pa")],
+        }, activa=True)
 
-        # SOLO crear config_container si es admin
-        if self.rol_actual == "admin":
-            print(f"DEBUG: Creando ConfiguracionContainer para admin: {self.usuario_actual}")
-            self.config_container = ConfiguracionContainer(
-                page=self.page,
-                reloj_global=self.reloj_global,
-                usuario_actual=self.usuario_actual,
-                rol_actual=self.rol_actual
-            )
-            print("DEBUG: ConfiguracionContainer creado para admin")
-        else:
-            self.config_container = ft.Container(
-                bgcolor=ft.Colors.WHITE,
-                border_radius=20,
-                expand=True,
-                alignment=ft.alignment.center,
-                content=ft.Column(
-                    alignment=ft.MainAxisAlignment.CENTER,
-                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                    spacing=20,
-                    controls=[
-                        ft.Icon(ft.Icons.LOCK, size=80, color=ft.Colors.GREY_400),
-                        ft.Text(
-                            "Acceso Restringido",
-                            size=28,
-                            weight=ft.FontWeight.BOLD,
-                            color=ft.Colors.GREY_600,
-                        ),
-                        ft.Text(
-                            "Esta sección solo está disponible\npara usuarios administradores",
-                            size=16,
-                            color=ft.Colors.GREY_500,
-                            text_align=ft.TextAlign.CENTER,
-                        ),
-                    ]
-                )
-            )
+        # Las demás páginas se construyen al visitarlas por primera vez
+        self.blue_boxes = {}
+        self.vista_manometros = None
+        self.config_container = None
 
         # PAGUINA 1 (UMA)
         self.home_container_1 = ft.Container(
@@ -904,88 +1130,24 @@ class UI(ft.Container):
             )
         )
 
-        # PAGUINA 2 (MANOMETROS)
-        self.location_container_1 = ft.Container(
-            bgcolor=self.color_teal,
-            border_radius=20,
-            expand=True,
-            padding=20,
-            content=ft.Column(
-                alignment=ft.MainAxisAlignment.START,
-                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                expand=True,
-                controls=[
-                    ft.Container(
-                        expand=True,
-                        bgcolor=ft.Colors.WHITE,
-                        border_radius=20,
-                        alignment=ft.alignment.center,
-                        padding=20,
-                        shadow=ft.BoxShadow(
-                            spread_radius=1,
-                            blur_radius=10,
-                            color=ft.Colors.GREY_300,
-                        ),
-                        content=ft.Column(
-                            scroll=ft.ScrollMode.AUTO,
-                            spacing=30,
-                            controls=[
-                                ft.Row(
-                                    alignment=ft.MainAxisAlignment.CENTER,
-                                    vertical_alignment=ft.CrossAxisAlignment.CENTER,
-                                    spacing=30,
-                                    controls=[
-                                        self.blue_box_presion1,
-                                        self.blue_box_presion2,
-                                        self.blue_box_presion3,
-                                    ]
-                                )
-                            ]
-                        )
-                    )
-                ]
-            )
-        )
-
-        # PAGUINA 3 (CONFIGURACION)
-        self.calendar_container_1 = ft.Container(
-            bgcolor=self.color_teal,
-            border_radius=20,
-            expand=True,
-            padding=20,
-            content=ft.Column(
-                alignment=ft.MainAxisAlignment.CENTER,
-                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                expand=True,
-                controls=[self.config_container]
-            )
-        )
-
-        # PAGUINA 4 (ALERTAS)
-        self.setting_container_1 = ft.Container(
-            bgcolor=self.color_teal,
-            border_radius=20,
-            expand=True,
-            padding=20,
-            content=ft.Container()  # Contenedor temporal vacío
-        )
-
         # Lista de contenedores - MODIFICADO según rol
+        # Cada entrada tiene su fábrica; solo UMA (la primera pantalla) se construye ya
         if self.rol_actual == "admin":
             # Admin: UMA, Manómetros, Configuración, Alertas
-            self.container_list_1 = [
-                self.home_container_1,          # 0: UMA
-                self.location_container_1,      # 1: Manómetros
-                self.calendar_container_1,      # 2: Configuración
-                self.setting_container_1        # 3: Alertas
+            self.fabricas_paginas = [
+                None,                                   # 0: UMA
+                self._construir_pagina_manometros,      # 1: Manómetros
+                self._construir_pagina_configuracion,   # 2: Configuración
+                self._construir_pagina_alertas          # 3: Alertas
             ]
         else:
             # Usuario normal: UMA, Manómetros, Alertas (NO Configuración)
-            self.container_list_1 = [
-                self.home_container_1,          # 0: UMA
-                self.location_container_1,      # 1: Manómetros
-                self.setting_container_1        # 2: Alertas
+            self.fabricas_paginas = [
+                None,                                   # 0: UMA
+                self._construir_pagina_manometros,      # 1: Manómetros
+                self._construir_pagina_alertas          # 2: Alertas
             ]
+        self.container_list_1 = [self.home_container_1] + [None] * (len(self.fabricas_paginas) - 1)
         
         self.container_1 = ft.Container(
             content=self.container_list_1[0], 
@@ -1129,6 +1291,147 @@ class UI(ft.Container):
         self.iniciar_home_random()
         self.actualizar_colores_botones(0)
 
+    def _obtener_pagina(self, index):
+        """Devuelve la página de container_list_1, construyéndola en la primera visita"""
+        if self.container_list_1[index] is None:
+            inicio = time.perf_counter()
+            self.container_list_1[index] = self.fabricas_paginas[index]()
+            print(f"UI: Página {index} construida en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return self.container_list_1[index]
+
+    def _construir_pagina_manometros(self):
+        """Fábrica de la página de manómetros"""
+        self.blue_box_presion1 = BlueBox(texto_titulo="MANOMETRO 1",texto=f"{self.datos_tiempo_real['presion1']} Pa", mostrar_boton=False)
+        self.blue_box_presion2 = BlueBox(texto_titulo="MANOMETRO 2",texto=f"{self.datos_tiempo_real['presion2']} Pa", mostrar_boton=False)
+        self.blue_box_presion3 = BlueBox(texto_titulo="MANOMETRO 3",texto=f"{self.datos_tiempo_real['presion3']} Pa", mostrar_boton=False)
+        
+        self.blue_boxes = {
+            'presion1': self.blue_box_presion1,
+            'presion2': self.blue_box_presion2,
+            'presion3': self.blue_box_presion3,
+        }
+        
+        self.vista_manometros = VistaLecturas(self.page, {
+            key: [(box.texto_principal, "{} Pa")] for key, box in self.blue_boxes.items()
+        })
+        # Al mostrarse por primera vez enseña la última lectura conocida
+        self.vista_manometros.ultimas = dict(self.datos_tiempo_real)
+
+        # PAGUINA 2 (MANOMETROS)
+        self.location_container_1 = ft.Container(
+            bgcolor=self.color_teal,
+            border_radius=20,
+            expand=True,
+            padding=20,
+            content=ft.Column(
+                alignment=ft.MainAxisAlignment.START,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                expand=True,
+                controls=[
+                    ft.Container(
+                        expand=True,
+                        bgcolor=ft.Colors.WHITE,
+                        border_radius=20,
+                        alignment=ft.alignment.center,
+                        padding=20,
+                        shadow=ft.BoxShadow(
+                            spread_radius=1,
+                            blur_radius=10,
+                            color=ft.Colors.GREY_300,
+                        ),
+                        content=ft.Column(
+                            scroll=ft.ScrollMode.AUTO,
+                            spacing=30,
+                            controls=[
+                                ft.Row(
+                                    alignment=ft.MainAxisAlignment.CENTER,
+                                    vertical_alignment=ft.CrossAxisAlignment.CENTER,
+                                    spacing=30,
+                                    controls=[
+                                        self.blue_box_presion1,
+                                        self.blue_box_presion2,
+                                        self.blue_box_presion3,
+                                    ]
+                                )
+                            ]
+                        )
+                    )
+                ]
+            )
+        )
+
+        return self.location_container_1
+
+    def _construir_pagina_configuracion(self):
+        """Fábrica de la página de configuración"""
+        # SOLO crear config_container si es admin
+        if self.rol_actual == "admin":
+            print(f"DEBUG: Creando ConfiguracionContainer para admin: {self.usuario_actual}")
+            self.config_container = ConfiguracionContainer(
+                page=self.page,
+                reloj_global=self.reloj_global,
+                usuario_actual=self.usuario_actual,
+                rol_actual=self.rol_actual
+            )
+            print("DEBUG: ConfiguracionContainer creado para admin")
+        else:
+            self.config_container = ft.Container(
+                bgcolor=ft.Colors.WHITE,
+                border_radius=20,
+                expand=True,
+                alignment=ft.alignment.center,
+                content=ft.Column(
+                    alignment=ft.MainAxisAlignment.CENTER,
+                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                    spacing=20,
+                    controls=[
+                        ft.Icon(ft.Icons.LOCK, size=80, color=ft.Colors.GREY_400),
+                        ft.Text(
+                            "Acceso Restringido",
+                            size=28,
+                            weight=ft.FontWeight.BOLD,
+                            color=ft.Colors.GREY_600,
+                        ),
+                        ft.Text(
+                            "Esta sección solo está disponible\npara usuarios administradores",
+                            size=16,
+                            color=ft.Colors.GREY_500,
+                            text_align=ft.TextAlign.CENTER,
+                        ),
+                    ]
+                )
+            )
+
+        # PAGUINA 3 (CONFIGURACION)
+        self.calendar_container_1 = ft.Container(
+            bgcolor=self.color_teal,
+            border_radius=20,
+            expand=True,
+            padding=20,
+            content=ft.Column(
+                alignment=ft.MainAxisAlignment.CENTER,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                expand=True,
+                controls=[self.config_container]
+            )
+        )
+
+        return self.calendar_container_1
+
+    def _construir_pagina_alertas(self):
+        """Fábrica de la página de alertas"""
+        # PAGUINA 4 (ALERTAS)
+        self.setting_container_1 = ft.Container(
+            bgcolor=self.color_teal,
+            border_radius=20,
+            expand=True,
+            padding=20,
+            content=ft.Container()  # Contenedor temporal vacío
+        )
+
+        self.inicializar_alertas_view()
+        return self.setting_container_1
+
     def redondear_entero_desde_6(self, valor):
         """Redondea hacia arriba desde 0.6"""
         parte_entera = int(valor)
@@ -1157,42 +1460,9 @@ class UI(ft.Container):
             'presion3': pres3,
         }
 
-        # Actualizar manómetros
-        for key, box in self.blue_boxes.items():
-            if hasattr(box, 'actualizar_valor'):
-                valor = self.datos_tiempo_real[key]
-                box.actualizar_valor(f"{valor} Pa")
-
-        # Verificar alertas
-        if temp > 30:
-            self.sistema_alertas.agregar_alerta(
-                causa=f"Temperatura CRÍTICA: {temp}°C (supera 30°C)",
-                pagina="UMA"
-            )
-        
-        if hum > 85:
-            self.sistema_alertas.agregar_alerta(
-                causa=f"Humedad ALTA: {hum}% (superior a 85%)",
-                pagina="UMA"
-            )
-        
-        if pres1 > 108:
-            self.sistema_alertas.agregar_alerta(
-                causa=f"Presión ALTA: {pres1}Pa (supera 108 Pa)",
-                pagina="UMA"
-            )
-        
-        if pres2 > 108:
-            self.sistema_alertas.agregar_alerta(
-                causa=f"Presión ALTA: {pres2}Pa (supera 108 Pa)",
-                pagina="UMA"
-            )
-        
-        if pres3 > 108:
-            self.sistema_alertas.agregar_alerta(
-                causa=f"Presión ALTA: {pres3}Pa (supera 108 Pa)",
-                pagina="UMA"
-            )
+        # Verificar alertas: un episodio por excursión, no una alerta por lectura
+        for canal, valor in self.datos_tiempo_real.items():
+            self.detector_alertas.evaluar(canal, valor)
         
         return {"presion1": pres1, "presion2": pres2, "presion3": pres3, "temperatura": temp, "humedad": hum}
     
@@ -1202,14 +1472,10 @@ class UI(ft.Container):
             while True:
                 datos = self.generar_datos_random()
                 
-                def actualizar():
-                    # Actualiza los controles que UMA usa
-                    self.txt_temp_home.value = f"{datos['temperatura']} °C"
-                    self.txt_hum_home.value = f"{datos['humedad']} %"
-                    self.txt_pres_home.value = f"{datos['presion1']} Pa"
-                    self.page.update()
-                
-                self.page.run_thread(actualizar)
+                # Las alertas se evalúan siempre; la UI solo se toca en la página visible
+                self.vista_lecturas_home.mostrar(datos)
+                if self.vista_manometros is not None:
+                    self.vista_manometros.mostrar(datos)
                 time.sleep(2)
         
         threading.Thread(target=loop, daemon=True).start()
@@ -1217,21 +1483,33 @@ class UI(ft.Container):
     def change_page_manual(self, index):
         """Cambia entre páginas de la aplicación"""
         if index < len(self.container_list_1):
-            self.container_1.content = self.container_list_1[index]
+            self.container_1.content = self._obtener_pagina(index)
             self.actualizar_colores_botones(index)
             
-            if self.alertas_view is not None:
-                # Determinar índice de alertas según rol
-                alertas_index = 2 if self.rol_actual != "admin" else 3
-                if index == alertas_index:  # Página de alertas
-                    if hasattr(self.alertas_view, 'entrar_a_pagina'):
-                        self.alertas_view.entrar_a_pagina()
-                else:
-                    if hasattr(self.alertas_view, 'salir_de_pagina'):
-                        self.alertas_view.salir_de_pagina()
+            # Ciclo de vida: las páginas ocultas dejan de refrescarse y la visible se pone al día
+            for i in range(len(self.container_list_1)):
+                if i != index:
+                    for participante in self._participantes_pagina(i):
+                        participante.desactivar()
+            for participante in self._participantes_pagina(index):
+                participante.activar()
 
             self.page.update()
     
+    def _participantes_pagina(self, index):
+        """Objetos con activar()/desactivar() de cada entrada de container_list_1"""
+        participantes = [
+            [self.uma_instance, self.vista_lecturas_home],  # UMA
+            [self.vista_manometros],                        # Manómetros
+        ]
+        if self.rol_actual == "admin":
+            participantes.append([self.config_container])   # Configuración
+        participantes.append([self.alertas_view])           # Alertas
+        
+        if index >= len(participantes):
+            return []
+        return [p for p in participantes[index] if p is not None and hasattr(p, 'activar')]
+    
     def actualizar_colores_botones(self, index_activo):
         """Actualiza los colores y formas de los botones de navegación"""
         # Determinar qué botones están presentes según rol
@@ -1,92 +1,6 @@
 import flet as ft
-import json
-import os
-import datetime
-
-class SistemaHistorial:
-    def __init__(self, archivo="historial_registros.json"):
-        self.archivo = archivo
-        self.registros = []
-        self.proximo_id = 1
-        self.cargar_registros()
-
-    def cargar_registros(self):
-        """Carga los registros desde el archivo JSON - Lee el formato correcto"""
-        if os.path.exists(self.archivo):
-            try:
-                with open(self.archivo, "r", encoding='utf-8') as f:
-                    self.registros = json.load(f)
-                
-                # Asignar IDs si no existen
-                for i, registro in enumerate(self.registros):
-                    if "id" not in registro:
-                        registro["id"] = i + 1
-                
-                # Calcular próximo ID
-                if self.registros:
-                    max_id = max(reg.get("id", 0) for reg in self.registros)
-                    self.proximo_id = max_id + 1
-                else:
-                    self.proximo_id = 1
-                    
-                # print(f"Historial: {len(self.registros)} registros cargados")
-            except Exception as e:
-                print(f"Error cargando registros: {e}")
-                self.registros = []
-        else:
-            # print(f"Creando nuevo archivo: {self.archivo}")
-            self.registros = []
-        
-        return self.registros
-    
-    def guardar_registros(self):
-        """Guarda los registros en el archivo JSON"""
-        try:
-            with open(self.archivo, "w", encoding='utf-8') as f:
-                json.dump(self.registros, f, ensure_ascii=False, indent=4)
-        except Exception as e:
-            print(f"Error guardando: {e}")
-    
-    def agregar_registro(self, temperatura, humedad, presion, tipo="manual", fuente="UMA"):
-        """Agrega un nuevo registro al historial - EN EL MISMO FORMATO que RelojGlobal"""
-        ahora = datetime.datetime.now()
-        
-        registro = {
-            "id": self.proximo_id,
-            "fecha": ahora.strftime("%d/%m/%y"),
-            "hora": ahora.strftime("%H:%M"),
-            "datos": {  # <-- MISMO FORMATO: datos dentro de "datos"
-                "temperatura": temperatura,
-                "humedad": humedad,
-                "presion1": presion  # <-- presion1 para coincidir
-            },
-            "tipo": tipo,
-            "fuente": fuente
-        }
-        
-        self.registros.append(registro)
-        self.proximo_id += 1
-        self.guardar_registros()
-        print(f"✓ Registro #{registro['id']} agregado")
-        return registro
-    
-    def eliminar_todos_registros(self):
-        """Elimina todos los registros"""
-        total = len(self.registros)
-        self.registros.clear()
-        self.proximo_id = 1
-        self.guardar_registros()
-        #print(f"{total} registros eliminados")
-    
-    def obtener_registros(self):
-        """Devuelve todos los registros (siempre actualizados)"""
-        self.cargar_registros()  # Siemrecargar para tener datos frescos
-        return self.registros.copy()
-    
-    def contar_registros(self):
-        """Cuenta el número de registros"""
-        return len(self.registros)
-
+from historial import SistemaHistorial, formatear_ts
+from actualizaciones import programar_actualizacion
 
 class UMA(ft.Container):
     def __init__(self, txt_temp, txt_hum, txt_pres, page=None, reloj_global=None,  on_registro_manual=None):
@@ -101,12 +15,19 @@ class UMA(ft.Container):
         self.bandera_btn_registro = False
         self.on_registro_manual = on_registro_manual  # Callback
         
-        # Sistema de historial
-        self.historial = SistemaHistorial()
+        # Página visible (la de inicio lo está al arrancar); oculta solo marca pendientes
+        self.activa = True
+        self._lista_pendiente = False
+        
+        # Sistema de historial (compartido con el reloj global)
+        if self.reloj_global and hasattr(self.reloj_global, 'historial'):
+            self.historial = self.reloj_global.historial
+        else:
+            self.historial = SistemaHistorial()
         
         # Registrar callback para actualizaciones automáticas
         if self.reloj_global:
-            self.reloj_global.agregar_callback_historial(self.actualizar_lista)
+            self.reloj_global.agregar_callback_historial(self._on_registro_historial)
         
         # Botones
         self.btn_registro = ft.ElevatedButton(
@@ -140,6 +61,22 @@ class UMA(ft.Container):
         # Cargar datos iniciales
         self.cargar_datos_despues_de_ui()
     
+    def activar(self):
+        """La página se muestra: ponerse al día si llegaron registros mientras estaba oculta"""
+        self.activa = True
+        if self._lista_pendiente:
+            self._lista_pendiente = False
+            self.actualizar_lista()
+    
+    def desactivar(self):
+        self.activa = False
+    
+    def _on_registro_historial(self, registro=None):
+        if self.activa:
+            self.actualizar_lista(registro)
+        else:
+            self._lista_pendiente = True
+    
     def cargar_datos_despues_de_ui(self):
         """Carga los datos después de que la UI esté lista"""
         self.actualizar_lista()
@@ -379,12 +316,11 @@ class UMA(ft.Container):
     
     def limpiar_todo(self, e):
         """Limpia todo el historial"""
-        # Limpiar el historial local
-        self.historial.eliminar_todos_registros()
-        
-        # También limpiar el historial del RelojGlobal
+        # El historial es compartido: limpiarlo desde el RelojGlobal notifica a todos
         if self.reloj_global:
             self.reloj_global.limpiar_historial()
+        else:
+            self.historial.eliminar_todos_registros()
         
         # Actualizar la lista
         self.actualizar_lista()
@@ -403,26 +339,22 @@ class UMA(ft.Container):
             )
             self.page.snack_bar = snackbar
             snackbar.open = True
-            self.page.update()
+            programar_actualizacion(self.page)
     
-    def actualizar_lista(self):
+    def actualizar_lista(self, registro_nuevo=None):
         """Actualiza la lista de historial - Lee datos desde la clave 'datos'"""
         try:
             # Limpiar lista
             self.lista_historial.controls.clear()
             
-            # Obtener registros actualizados
-            registros = self.historial.obtener_registros()
-            
             # Actualizar contador
-            total = len(registros)
+            total = self.historial.contar_registros()
             self.contador.value = f"{total} registros"
             
-            # Ordenar por ID (más recientes primero)
-            registros.sort(key=lambda x: x.get("id", 0), reverse=True)
+            # Leer solo los últimos 15 registros (más recientes primero)
+            registros = self.historial.ultimos(15)
             
-            # Mostrar últimos 15 registros
-            for registro in registros[:15]:
+            for registro in reversed(registros):
                 # OBTENER DATOS DESDE LA CLAVE 'datos'
                 datos = registro.get("datos", {})
                 temp = datos.get("temperatura", "N/A")
@@ -463,7 +395,7 @@ class UMA(ft.Container):
                                 controls=[
                                     ft.Text(f"#{registro.get('id', 'N/A')}", 
                                         size=12, weight=ft.FontWeight.BOLD),
-                                    ft.Text(f"{registro.get('fecha', '')} {registro.get('hora', '')}",
+                                    ft.Text(formatear_ts(registro["ts"]) if "ts" in registro else "",
                                         size=11, color=ft.Colors.GREY_600),
                                     ft.Container(expand=True),
                                     ft.Text(f"{icono} {fuente}", 
@@ -0,0 +1,281 @@
+"""Escritura directa de celdas en un .xlsm sin pasar por openpyxl.
+
+Solo se reescriben las partes sheetN.xml de las hojas afectadas; las demás
+partes del paquete (estilos, macros, etc.) se copian tal cual. Si la hoja
+no tiene la forma esperada se lanza ValueError para que el llamador use
+el guardado completo.
+"""
+
+import datetime
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+_NS_LIBRO = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PAQUETE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_RE_FILA = re.compile(r'<row\b[^>]*?\br="(\d+)"[^>]*?(?:/>|>.*?</row>)', re.S)
+_RE_CELDA = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_RE_REF = re.compile(r'\br="([A-Z]+)(\d+)"')
+_RE_ESTILO = re.compile(r'\bs="(\d+)"')
+_RE_FORMULA = re.compile(r'<f[\s>/]')
+_RE_DIMENSION = re.compile(r'<dimension ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"\s*/>')
+_RE_NUMFMT = re.compile(r'<numFmt\b[^>]*/>')
+_RE_NUMFMTS_VACIO = re.compile(r'<numFmts\b[^>]*/>')
+_RE_XF = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+_PATRON_ATRIBUTO = r'\b{}="([^"]*)"'
+
+# Formatos con que openpyxl escribe las fechas y horas en memoria
+FORMATO_FECHA = "DD-MMM-YYYY"
+FORMATO_HORA = "HH:MM"
+# Formatos de número integrados de Excel que muestran fecha u hora
+_INTEGRADOS_FECHA = set(range(14, 18)) | {22} | set(range(27, 37)) | set(range(50, 59))
+_INTEGRADOS_HORA = set(range(18, 23)) | set(range(45, 48))
+
+
+def _numero_columna(letras):
+    numero = 0
+    for letra in letras:
+        numero = numero * 26 + ord(letra) - 64
+    return numero
+
+
+def _rutas_hojas(zf):
+    """Devuelve ({nombre de hoja: parte xml}, fecha base del libro)"""
+    libro = ET.fromstring(zf.read("xl/workbook.xml"))
+    relaciones = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    destinos = {r.get("Id"): r.get("Target") for r in relaciones.iter(_NS_PAQUETE + "Relationship")}
+
+    rutas = {}
+    for hoja in libro.iter(_NS_LIBRO + "sheet"):
+        destino = destinos.get(hoja.get(_NS_REL + "id"), "")
+        rutas[hoja.get("name")] = destino.lstrip("/") if destino.startswith("/") else "xl/" + destino
+
+    propiedades = libro.find(_NS_LIBRO + "workbookPr")
+    fecha_1904 = propiedades is not None and propiedades.get("date1904") in ("1", "true")
+    base = datetime.datetime(1904, 1, 1) if fecha_1904 else datetime.datetime(1899, 12, 30)
+    return rutas, base
+
+
+def _atributo(etiqueta, nombre):
+    m = re.search(_PATRON_ATRIBUTO.format(nombre), etiqueta)
+    return m.group(1) if m else None
+
+
+class _Estilos:
+    """Formatos de número de styles.xml.
+
+    Una fecha u hora solo se escribe con un estilo cuyo formato la muestre
+    como tal; si el estilo de la celda no lo hace, se agrega una copia del
+    estilo con FORMATO_FECHA o FORMATO_HORA (como hace openpyxl en memoria).
+    """
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.modificado = False
+        self._formatos = {
+            int(_atributo(m.group(0), "numFmtId")): _atributo(m.group(0), "formatCode") or ""
+            for m in _RE_NUMFMT.finditer(xml)
+        }
+        inicio, fin = self._rango_xfs()
+        self._xfs = [m.group(0) for m in _RE_XF.finditer(xml, inicio, fin)]
+        if not self._xfs:
+            raise ValueError("styles.xml sin cellXfs")
+        self._agregados = {}  # (estilo, tipo) -> índice nuevo
+
+    def _rango_xfs(self):
+        inicio = self.xml.find("<cellXfs")
+        fin = self.xml.find("</cellXfs>", inicio)
+        if inicio < 0 or fin < 0:
+            raise ValueError("styles.xml sin cellXfs")
+        return inicio, fin
+
+    def _muestra(self, id_formato, tipo):
+        """Si el formato de número muestra el tipo ("fecha" u "hora")"""
+        if id_formato in self._formatos:
+            # Quitar textos entre comillas y secciones [..] (colores, moneda)
+            codigo = re.sub(r'"[^"]*"|\[[^\]]*\]', "", self._formatos[id_formato]).lower()
+            return any(letra in codigo for letra in ("dy" if tipo == "fecha" else "hs"))
+        return id_formato in (_INTEGRADOS_FECHA if tipo == "fecha" else _INTEGRADOS_HORA)
+
+    def para(self, estilo, tipo):
+        """Índice de un estilo como `estilo` que muestra el tipo; lo agrega si hace falta"""
+        indice = int(estilo) if estilo is not None else 0
+        if indice >= len(self._xfs):
+            raise ValueError(f"estilo {indice} inexistente")
+        if self._muestra(int(_atributo(self._xfs[indice], "numFmtId") or 0), tipo):
+            return str(indice)
+        if (indice, tipo) not in self._agregados:
+            self._agregados[(indice, tipo)] = self._agregar(indice, FORMATO_FECHA if tipo == "fecha" else FORMATO_HORA)
+        return str(self._agregados[(indice, tipo)])
+
+    def _id_formato(self, codigo):
+        """Id del formato de número con ese código; lo agrega a <numFmts> si no existe"""
+        for id_formato, existente in self._formatos.items():
+            if existente == codigo:
+                return id_formato
+        id_formato = max([163] + list(self._formatos)) + 1
+        self._formatos[id_formato] = codigo
+        etiqueta = f'<numFmt numFmtId="{id_formato}" formatCode="{codigo}"/>'
+        vacio = _RE_NUMFMTS_VACIO.search(self.xml)
+        if vacio is not None:
+            # openpyxl escribe <numFmts count="0"/> cuando no hay formatos propios
+            self.xml = self.xml[:vacio.start()] + f'<numFmts count="1">{etiqueta}</numFmts>' + self.xml[vacio.end():]
+        elif "</numFmts>" in self.xml:
+            self.xml = self.xml.replace("</numFmts>", etiqueta + "</numFmts>", 1)
+            self.xml = re.sub(r'(<numFmts\b[^>]*\bcount=")\d+', lambda m: m.group(1) + str(len(self._formatos)),
+                              self.xml, count=1)
+        else:
+            # <numFmts> debe ser el primer hijo de <styleSheet>
+            apertura = re.search(r'<styleSheet\b[^>]*>', self.xml)
+            if apertura is None:
+                raise ValueError("styles.xml sin styleSheet")
+            self.xml = self.xml[:apertura.end()] + f'<numFmts count="1">{etiqueta}</numFmts>' + self.xml[apertura.end():]
+        return id_formato
+
+    def _agregar(self, indice, codigo):
+        """Agrega al final de cellXfs una copia del estilo con otro formato de número"""
+        id_formato = self._id_formato(codigo)
+        xf = self._xfs[indice]
+        apertura = xf[:xf.index(">") + 1]
+        nueva = re.sub(r'\s(numFmtId|applyNumberFormat)="[^"]*"', "", apertura)
+        nueva = nueva.replace("<xf", f'<xf numFmtId="{id_formato}" applyNumberFormat="1"', 1)
+        xf = nueva + xf[len(apertura):]
+
+        _, fin = self._rango_xfs()
+        self.xml = self.xml[:fin] + xf + self.xml[fin:]
+        self._xfs.append(xf)
+        self.xml = re.sub(r'(<cellXfs\b[^>]*\bcount=")\d+', lambda m: m.group(1) + str(len(self._xfs)),
+                          self.xml, count=1)
+        self.modificado = True
+        return len(self._xfs) - 1
+
+
+def _xml_celda(referencia, valor, estilo, base):
+    """Elemento <c> para un número, fecha, hora o texto"""
+    atributo_estilo = f' s="{estilo}"' if estilo is not None else ""
+    if isinstance(valor, datetime.time):
+        if estilo is None:
+            raise ValueError(f"sin formato de hora para {referencia}")
+        fraccion = (valor.hour * 3600 + valor.minute * 60 + valor.second) / 86400
+        return f'<c r="{referencia}"{atributo_estilo}><v>{fraccion:.10g}</v></c>'
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        if not isinstance(valor, datetime.datetime):
+            valor = datetime.datetime.combine(valor, datetime.time())
+        if estilo is None:
+            raise ValueError(f"sin formato de fecha para {referencia}")
+        serial = (valor - base).total_seconds() / 86400
+        return f'<c r="{referencia}"{atributo_estilo}><v>{serial:.10g}</v></c>'
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        texto = escape(str(valor))
+        return f'<c r="{referencia}"{atributo_estilo} t="inlineStr"><is><t>{texto}</t></is></c>'
+    return f'<c r="{referencia}"{atributo_estilo}><v>{valor!r}</v></c>'
+
+
+def _parchar_hoja(xml, filas, base, formatos):
+    """Escribe {fila: {columna: valor}} en el xml de una hoja"""
+    inicio_datos = xml.find("<sheetData")
+    if inicio_datos < 0:
+        raise ValueError("hoja sin sheetData")
+    if xml.startswith("<sheetData/>", inicio_datos):
+        xml = xml[:inicio_datos] + "<sheetData></sheetData>" + xml[inicio_datos + len("<sheetData/>"):]
+    fin_datos = xml.find("</sheetData>", inicio_datos)
+
+    existentes = {}  # fila -> (inicio, fin)
+    estilos = {}  # columna -> [(fila, estilo)] para copiar el formato de la fila anterior
+    for m in _RE_FILA.finditer(xml, inicio_datos, fin_datos):
+        numero = int(m.group(1))
+        existentes[numero] = (m.start(), m.end())
+        for c in _RE_CELDA.finditer(m.group(0)):
+            ref, estilo = _RE_REF.search(c.group(1)), _RE_ESTILO.search(c.group(1))
+            if ref and estilo:
+                estilos.setdefault(ref.group(1), []).append((numero, estilo.group(1)))
+
+    def estilo_anterior(columna, fila):
+        candidatos = [e for f, e in estilos.get(columna, []) if f <= fila]
+        return candidatos[-1] if candidatos else None
+
+    # De abajo hacia arriba: las posiciones de las filas anteriores no cambian
+    for numero in sorted(filas, reverse=True):
+        valores = {c: v for c, v in filas[numero].items() if v is not None}
+        if numero in existentes:
+            inicio, fin = existentes[numero]
+            fila_xml = xml[inicio:fin]
+            if fila_xml.endswith("/>"):
+                fila_xml = fila_xml[:-2] + "></row>"
+            apertura = fila_xml[:fila_xml.index(">") + 1]
+            celdas = []
+            for c in _RE_CELDA.finditer(fila_xml, len(apertura)):
+                ref = _RE_REF.search(c.group(1))
+                if ref is None:
+                    raise ValueError(f"celda sin referencia en la fila {numero}")
+                celdas.append((ref.group(1), c.group(0)))
+        else:
+            inicio = fin = next((i for f, (i, _) in sorted(existentes.items()) if f > numero), fin_datos)
+            apertura = f'<row r="{numero}">'
+            celdas = []
+
+        actuales = dict(celdas)
+        for columna, valor in valores.items():
+            anterior = actuales.get(columna)
+            if anterior and _RE_FORMULA.search(anterior):
+                raise ValueError(f"{columna}{numero} tiene una fórmula")
+            estilo = _RE_ESTILO.search(anterior) if anterior else None
+            estilo = estilo.group(1) if estilo else estilo_anterior(columna, numero)
+            if isinstance(valor, datetime.time):
+                estilo = formatos.para(estilo, "hora")
+            elif isinstance(valor, (datetime.date, datetime.datetime)):
+                estilo = formatos.para(estilo, "fecha")
+            actuales[columna] = _xml_celda(f"{columna}{numero}", valor, estilo, base)
+
+        contenido = "".join(actuales[c] for c in sorted(actuales, key=_numero_columna))
+        xml = xml[:inicio] + apertura + contenido + "</row>" + xml[fin:]
+
+    return _ampliar_dimension(xml, max(filas))
+
+
+def _ampliar_dimension(xml, ultima_fila):
+    """Actualiza <dimension> si las filas nuevas quedan fuera del rango"""
+    m = _RE_DIMENSION.search(xml)
+    if m is None or m.group(3) is None or int(m.group(4)) >= ultima_fila:
+        return xml
+    return xml[:m.start()] + f'<dimension ref="{m.group(1)}{m.group(2)}:{m.group(3)}{ultima_fila}"/>' + xml[m.end():]
+
+
+def escribir_celdas(archivo, cambios):
+    """Escribe cambios = {hoja: {fila: {columna: valor}}} directamente en el paquete.
+
+    Se arma un paquete nuevo en un temporal y se reemplaza el original; si
+    el archivo está bloqueado se propaga el error del sistema (OSError) y
+    no queda el temporal.
+    """
+    with zipfile.ZipFile(archivo) as origen:
+        rutas, base = _rutas_hojas(origen)
+        if "xl/styles.xml" not in origen.namelist():
+            raise ValueError("libro sin styles.xml")
+        formatos = _Estilos(origen.read("xl/styles.xml").decode("utf-8"))
+        parches = {}
+        for nombre_hoja, filas in cambios.items():
+            if nombre_hoja not in rutas:
+                raise ValueError(f"hoja no encontrada: {nombre_hoja}")
+            ruta = rutas[nombre_hoja]
+            xml = origen.read(ruta).decode("utf-8")
+            parches[ruta] = _parchar_hoja(xml, filas, base, formatos).encode("utf-8")
+        if formatos.modificado:
+            parches["xl/styles.xml"] = formatos.xml.encode("utf-8")
+
+    temporal = archivo + ".tmp"
+    try:
+        with zipfile.ZipFile(archivo) as origen, zipfile.ZipFile(temporal, "w") as destino:
+            for info in origen.infolist():
+                # Las partes sin cambios se copian con su contenido intacto
+                destino.writestr(info, parches.get(info.filename) or origen.read(info.filename))
+        os.replace(temporal, archivo)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return sum(len(filas) for filas in cambios.values())
@@ -0,0 +1,95 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class RuedaTemporizadores:
+    """Un solo hilo para todas las acciones diferidas de la UI.
+
+    Desvanecer el puntito de alertas, devolver un botón a su tamaño, cerrar
+    un aviso... en lugar de crear un hilo que duerme por cada efecto, se
+    agendan aquí. Las acciones se ejecutan en el hilo de la rueda, así que
+    deben ser cortas (cambiar propiedades y llamar a update()).
+    """
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._agenda = []  # heap de (vence, secuencia, clave)
+        self._acciones = {}  # clave -> (secuencia, funcion, args)
+        self._secuencia = itertools.count()
+        self._hilo = None
+        self.activa = True
+
+    def programar(self, retraso, funcion, *args, clave=None):
+        """Ejecuta funcion(*args) dentro de `retraso` segundos.
+
+        Si se indica una clave, reprogramar con la misma clave reemplaza la
+        acción pendiente (p. ej. varios parpadeos seguidos dejan un solo
+        desvanecido). Devuelve la clave para poder cancelarla.
+        """
+        with self._condicion:
+            secuencia = next(self._secuencia)
+            if clave is None:
+                clave = ("anonima", secuencia)
+            self._acciones[clave] = (secuencia, funcion, args)
+            heapq.heappush(self._agenda, (time.monotonic() + retraso, secuencia, clave))
+            self._iniciar()
+            self._condicion.notify()
+        return clave
+
+    def cancelar(self, clave):
+        """Cancela la acción pendiente con esa clave (si existe)"""
+        with self._condicion:
+            return self._acciones.pop(clave, None) is not None
+
+    def pendientes(self):
+        with self._condicion:
+            return len(self._acciones)
+
+    def detener(self):
+        with self._condicion:
+            self.activa = False
+            self._condicion.notify_all()
+
+    def _iniciar(self):
+        """Arranca el hilo la primera vez que se agenda algo (requiere el lock)"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._loop, name="RuedaTemporizadores", daemon=True)
+            self._hilo.start()
+
+    def _siguiente(self):
+        """Espera a la próxima acción vencida y la devuelve (o None si hay que revisar de nuevo)"""
+        with self._condicion:
+            # Descartar entradas canceladas o reemplazadas
+            while self._agenda and self._acciones.get(self._agenda[0][2], (None,))[0] != self._agenda[0][1]:
+                heapq.heappop(self._agenda)
+
+            if not self._agenda:
+                self._condicion.wait()
+                return None
+
+            vence, _, clave = self._agenda[0]
+            espera = vence - time.monotonic()
+            if espera > 0:
+                self._condicion.wait(espera)
+                return None
+
+            heapq.heappop(self._agenda)
+            _, funcion, args = self._acciones.pop(clave)
+            return funcion, args
+
+    def _loop(self):
+        while self.activa:
+            pendiente = self._siguiente()
+            if pendiente is None:
+                continue
+            funcion, args = pendiente
+            try:
+                funcion(*args)
+            except Exception as e:
+                print(f"RuedaTemporizadores: Error en acción diferida: {e}")
+
+
+# Rueda compartida por toda la aplicación
+rueda_ui = RuedaTemporizadores()
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import flet as ft
+
+import alertas
+import main5
+
+
+class TestReingreso(unittest.TestCase):
+    """Cerrar sesión y volver a entrar no debe perder alertas pendientes de guardar"""
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.archivo = os.path.join(self.carpeta.name, "alertas.json")
+        self.creados = []
+
+        def crear_sistema(**opciones):
+            sistema = alertas.SistemaAlertas(archivo=self.archivo, fsync=False, **opciones)
+            self.creados.append(sistema)
+            return sistema
+
+        def componentes(ui):
+            ui.resp_container = ft.Container()
+
+        parches = [
+            mock.patch.object(main5, "SistemaAlertas", side_effect=crear_sistema),
+            mock.patch.object(main5, "ExcelUnicoArchivo", return_value=mock.MagicMock(tiempo_carga=None)),
+            mock.patch.object(main5, "RelojGlobal"),
+            mock.patch.object(main5.UI, "_iniciar_precarga"),
+            mock.patch.object(main5.UI, "mostrar_login"),
+            mock.patch.object(main5.UI, "crear_barra_usuario", lambda ui: ft.Container()),
+            mock.patch.object(main5.UI, "_initialize_ui_components", componentes),
+            mock.patch.object(main5.UI, "configurar_banner"),
+        ]
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.ui = main5.UI(mock.MagicMock())
+
+    def tearDown(self):
+        for sistema in self.creados:
+            sistema.cerrar()
+        self.carpeta.cleanup()
+
+    def test_reingreso_conserva_alertas_pendientes(self):
+        self.ui.on_login_success("operador", "usuario")
+        primera = self.ui.sistema_alertas
+        primera.agregar_alerta("Temperatura CRÍTICA", "UMA", "Termómetro", 31)
+        self.ui.cerrar_sesion(None)
+
+        self.ui.on_login_success("operador", "usuario")
+        self.assertIs(self.ui.sistema_alertas, primera)
+        self.assertEqual(len(self.creados), 1)
+        self.ui.sistema_alertas.agregar_alerta("Humedad ALTA", "UMA", "Hidrómetro", 90)
+        self.ui.sistema_alertas.cerrar()
+
+        with open(self.archivo, encoding="utf-8") as f:
+            causas = [alerta["causa"] for alerta in json.load(f)]
+        self.assertEqual(causas, ["Temperatura CRÍTICA", "Humedad ALTA"])
+
+
+class TestEpisodiosAbiertos(unittest.TestCase):
+    """Un episodio abierto al reiniciar se continúa en lugar de abrir otro"""
+
+    CANALES = {"temperatura": {"activar": 30, "liberar": 28, "permanencia": 4, "causa": "Temperatura CRÍTICA",
+                               "unidad": "°C", "elemento": "Termómetro"}}
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.carpeta.cleanup)
+        self.archivo = os.path.join(self.carpeta.name, "alertas.json")
+
+    def _sistema(self):
+        return alertas.SistemaAlertas(archivo=self.archivo, intervalo_guardado=0, fsync=False)
+
+    def _episodios(self, sistema):
+        return [alerta["episodio"] for alerta in sistema.obtener_alertas() if "episodio" in alerta]
+
+    def test_reinicio_continua_el_episodio(self):
+        detector = alertas.DetectorEpisodios(self._sistema(), "UMA", self.CANALES)
+        for segundo in range(0, 10, 2):
+            detector.evaluar("temperatura", 32, ahora=1000 + segundo)
+
+        sistema = self._sistema()
+        detector = alertas.DetectorEpisodios(sistema, "UMA", self.CANALES)
+        detector.evaluar("temperatura", 35, ahora=1020)
+        for segundo in range(0, 10, 2):
+            detector.evaluar("temperatura", 25, ahora=1030 + segundo)
+
+        episodios = self._episodios(sistema)
+        self.assertEqual(len(episodios), 1)
+        self.assertEqual(episodios[0]["inicio"], 1000)
+        self.assertEqual(episodios[0]["pico"], 35)
+        self.assertIsNotNone(episodios[0]["fin"])
+
+    def test_abiertos_repetidos_se_cierran(self):
+        sistema = self._sistema()
+        for inicio in (1000, 2000):
+            alerta = sistema.agregar_alerta("Temperatura CRÍTICA", "UMA", "Termómetro", 32)
+            sistema.actualizar_alerta(alerta["id"], episodio={"inicio": inicio, "fin": None, "pico": 32, "muestras": 3})
+
+        detector = alertas.DetectorEpisodios(self._sistema(), "UMA", self.CANALES)
+        episodios = self._episodios(detector.sistema)
+        self.assertEqual([e["fin"] for e in episodios], [2000, None])
+        self.assertEqual(detector.estados["temperatura"]["alerta_id"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import datetime
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+import openpyxl
+
+import parche_xlsm
+
+
+class TestEscribirCeldas(unittest.TestCase):
+    """Escritura directa sobre libros guardados por openpyxl"""
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.carpeta.cleanup)
+        self.archivo = os.path.join(self.carpeta.name, "Monitoreo_2026.xlsx")
+        libro = openpyxl.Workbook()
+        hoja = libro.active
+        hoja.title = "Temperatura"
+        hoja["A1"] = "Fecha"
+        hoja["B1"] = "Hora"
+        hoja["D1"] = "Valor"
+        libro.save(self.archivo)
+
+    def test_fechas_y_horas_se_leen_con_formato(self):
+        parche_xlsm.escribir_celdas(self.archivo, {"Temperatura": {
+            3: {"A": datetime.date(2026, 3, 1), "B": datetime.time(8, 15), "D": 21.5},
+            4: {"A": datetime.date(2026, 3, 2), "B": datetime.time(8, 15), "D": 22.0},
+        }})
+
+        with zipfile.ZipFile(self.archivo) as paquete:
+            estilos = paquete.read("xl/styles.xml").decode("utf-8")
+        self.assertEqual(estilos.count("<numFmts"), 1)
+
+        hoja = openpyxl.load_workbook(self.archivo)["Temperatura"]
+        for fila in (3, 4):
+            self.assertEqual(hoja[f"A{fila}"].number_format, parche_xlsm.FORMATO_FECHA)
+            self.assertEqual(hoja[f"B{fila}"].number_format, parche_xlsm.FORMATO_HORA)
+        self.assertEqual(hoja["A3"].value, datetime.datetime(2026, 3, 1))
+        self.assertEqual(hoja["B4"].value, datetime.time(8, 15))
+        self.assertEqual(hoja["D4"].value, 22.0)
+
+    def test_libro_bloqueado_no_deja_temporal(self):
+        with open(self.archivo, "rb") as f:
+            original = f.read()
+        with mock.patch.object(parche_xlsm.os, "replace", side_effect=PermissionError("bloqueado")):
+            with self.assertRaises(PermissionError):
+                parche_xlsm.escribir_celdas(self.archivo, {"Temperatura": {3: {"D": 21.5}}})
+
+        self.assertEqual(os.listdir(self.carpeta.name), ["Monitoreo_2026.xlsx"])
+        with open(self.archivo, "rb") as f:
+            self.assertEqual(f.read(), original)
+
+
+if __name__ == "__main__":
+    unittest.main()